@@ -1,18 +1,113 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, PrivateAttr, ValidationError, model_validator
+from typing import Optional, List, Literal
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date
+import asyncio
+import base64
+import collections
 import json
+import logging
 import os
+import time
 
-# Importar as funções de parsing e geração de PDF do prescreveai.py
+# Importar as funções de parsing do prescreveai.py
 # Assumimos que prescreveai.py está no mesmo diretório ou no PYTHONPATH
 # Para evitar conflitos de nome, podemos importar com um alias
+# A geração de PDF (reportlab) roda nos processos do render_engine
 import prescreveai as cli_parser
+from render_context import TEMPLATE_FILENAMES
+from render_engine import RenderEngine, RenderQueueFull, RenderTimeout
+from pdf_cache import PdfCache, cache_key
+from pdf_merge import MergedPdfWriter, error_pages
+from job_queue import JobNotFound, JobQueue, JobRunner
+from history_store import HistoryNotFound, HistoryStore, entry_context
+from live_preview import PreviewSession
+import drug_catalog
+import medparser
+import metrics
+import profiling
+
+logger = logging.getLogger(__name__)
+
+# Pool de processos que renderiza os PDFs fora do event loop
+render_engine = RenderEngine()
+
+# Cache dos PDFs já renderizados (memória + disco opcional)
+pdf_cache = PdfCache()
+
+# Histórico das prescrições emitidas (SQLite), consultado em /history
+history = HistoryStore()
+
+# Jobs do POST /prescribe?async=1: fila em SQLite consumida em segundo plano
+job_queue = JobQueue()
+job_runner = JobRunner(
+    job_queue,
+    lambda medications, context: render_job(medications, context),
+    concurrency=int(os.environ.get("PRESCREVEAI_JOBS_CONCURRENCY", 0)) or render_engine.workers,
+    lease_seconds=2 * render_engine.timeout + 30,
+    busy_errors=(RenderQueueFull,),
+)
+
+# --- Métricas expostas em /metrics (além dos tempos por estágio de metrics.py) ---
+REQUESTS_IN_FLIGHT = metrics.REGISTRY.register(metrics.Gauge(
+    "prescreveai_requests_in_flight",
+    "Requisições de prescrição em andamento, por endpoint.",
+    ("endpoint",),
+))
+metrics.REGISTRY.register(metrics.Gauge(
+    "prescreveai_render_queue_depth",
+    "Jobs aguardando ou em execução no pool de renderização.",
+    function=lambda: render_engine.pending,
+))
+metrics.REGISTRY.register(metrics.Gauge(
+    "prescreveai_render_queue_limit",
+    "Máximo de jobs pendentes antes de responder 503.",
+    function=lambda: render_engine.max_pending,
+))
+metrics.REGISTRY.register(metrics.Gauge(
+    "prescreveai_render_workers",
+    "Processos do pool de renderização.",
+    function=lambda: render_engine.workers,
+))
+PREVIEW_SESSIONS = metrics.REGISTRY.register(metrics.Gauge(
+    "prescreveai_preview_sessions",
+    "Sessões de pré-visualização (WebSocket /preview) abertas.",
+))
+# Atualizado pelo /metrics fora do event loop (a contagem é uma consulta ao SQLite)
+JOBS_PENDING = metrics.REGISTRY.register(metrics.Gauge(
+    "prescreveai_jobs_pending",
+    "Jobs assíncronos aguardando ou em renderização (todos os workers).",
+))
+metrics.REGISTRY.register(metrics.Counter(
+    "prescreveai_pdf_cache_hits_total",
+    "PDFs servidos pelo cache (memória e disco).",
+    function=lambda: pdf_cache.memory_hits + pdf_cache.disk_hits,
+))
+metrics.REGISTRY.register(metrics.Counter(
+    "prescreveai_pdf_cache_misses_total",
+    "PDFs que precisaram ser renderizados.",
+    function=lambda: pdf_cache.misses,
+))
+
+@asynccontextmanager
+async def lifespan(app):
+    # O uvicorn só passa a aceitar conexões neste worker depois do aquecimento
+    render_engine.start()
+    drug_catalog.default_catalog().load()
+    await warmup()
+    job_runner.start()
+    yield
+    # Jobs interrompidos voltam para a fila e são retomados no próximo início
+    await job_runner.stop()
+    render_engine.shutdown()
 
 app = FastAPI(
     title="PrescreveAI API",
     description="API para gerar prescrições médicas em formato JSON e PDF.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # --- Modelos Pydantic para validação de dados ---
@@ -30,46 +125,626 @@ class EmitterData(BaseModel):
     telefone: str
     cidade_uf: str
 
+class PatientData(BaseModel):
+    nome: str
+    cpf: str = ""
+    endereco: str = ""
+
 class PrescriptionRequest(BaseModel):
     medication_string: str
     emitter_data: EmitterData
+    patient_data: Optional[PatientData] = None # Sem paciente, usa render_context.DEFAULT_PATIENT
     template: str = "memed" # Default template
+    # "json": medicações + PDF em base64; "pdf": bytes do PDF (application/pdf)
+    response_format: Literal["json", "pdf"] = "json"
+
+    # Tempo da validação pelo pydantic, para o estágio "validation" das métricas
+    _validation_seconds: float = PrivateAttr(default=0.0)
+
+    @model_validator(mode="wrap")
+    @classmethod
+    def _timed_validation(cls, data, handler):
+        started = time.perf_counter()
+        request = handler(data)
+        request._validation_seconds = time.perf_counter() - started
+        return request
+
+class PreviewRenderMessage(BaseModel):
+    """Mensagem "render" do WebSocket /preview: o texto vem da sessão."""
+    template: str = "memed"
+    emitter_data: EmitterData
+    patient_data: Optional[PatientData] = None
 
 class PrescriptionResponse(BaseModel):
     medicacoes: List[Medication]
     pdf_filename: str
+    pdf_base64: str
+
+# Tamanho dos blocos enviados no modo de resposta "pdf"
+PDF_CHUNK_SIZE = 64 * 1024
+
+# PRESCREVEAI_FAST_JSON=1: a resposta "json" é montada direto em bytes a partir
+# dos registros do parser, sem passar de novo pela validação do PrescriptionResponse
+FAST_JSON = os.environ.get("PRESCREVEAI_FAST_JSON") == "1"
+
+def iter_chunks(data, chunk_size=PDF_CHUNK_SIZE):
+    for offset in range(0, len(data), chunk_size):
+        yield data[offset:offset + chunk_size]
+
+async def render_cached(medications, context, timings=None):
+    """
+    Retorna o PDF do cache quando ele já foi renderizado com os mesmos dados;
+    caso contrário renderiza no render_engine e guarda o resultado. Os tempos
+    da renderização vão para `timings` (veja RenderEngine.render).
+    """
+    key = cache_key(medications, context)
+    pdf_bytes = pdf_cache.get_memory(key)
+    if pdf_bytes is None and pdf_cache.disk_dir:
+        pdf_bytes = await asyncio.to_thread(pdf_cache.get_disk, key)
+    if pdf_bytes is not None:
+        return pdf_bytes
+
+    pdf_cache.record_miss()
+    pdf_bytes = await render_engine.render(medications, context, timings)
+    pdf_cache.put_memory(key, pdf_bytes)
+    if pdf_cache.disk_dir:
+        await asyncio.to_thread(pdf_cache.put_disk, key, pdf_bytes)
+    return pdf_bytes
+
+async def record_history(medications, context, pdf_bytes=None, source="api", repeated_from=None):
+    """
+    Grava a prescrição emitida no histórico, fora do event loop; retorna o id
+    (ou None). O PDF já foi gerado: uma falha do histórico (banco travado,
+    disco cheio) só é registrada no log, sem falhar a prescrição.
+    """
+    if not history.enabled:
+        return None
+    try:
+        return await asyncio.to_thread(history.record, medications, context, pdf_bytes, None, source, repeated_from)
+    except Exception:
+        logger.exception("Falha ao gravar a prescrição no histórico")
+        return None
+
+async def render_job(medications, context):
+    """Renderização de um job do POST /prescribe?async=1, que também entra no histórico."""
+    pdf_bytes = await render_cached(medications, context)
+    await record_history(medications, context, pdf_bytes, source="api-async")
+    return pdf_bytes
+
+def prepare_prescription(request):
+    """
+    Faz o parsing da string de medicação e monta o RenderContext da requisição.
+    Levanta HTTPException(400) para medicações inválidas ou template desconhecido.
+    """
+    # Registros medparser.Medication, usados como estão pelo render_engine e pela resposta
+    parsed = medparser.parse(request.medication_string)
+
+    if parsed.errors:
+        raise HTTPException(status_code=400, detail=parsed.errors[0].message)
+
+    if request.template not in TEMPLATE_FILENAMES:
+        raise HTTPException(status_code=400, detail=f"Template desconhecido: {request.template}")
+
+    context = cli_parser.RenderContext(
+        emitter=request.emitter_data.model_dump(),
+        template=request.template,
+        **({"patient": request.patient_data.model_dump()} if request.patient_data else {}),
+    )
+    return parsed.medications, context
 
 # --- Endpoint da API ---
 
-@app.post("/prescribe", response_model=PrescriptionResponse)
-async def prescribe(request: PrescriptionRequest):
-    # Chamar a função de parsing do prescreveai.py
-    parse_result = cli_parser.parse_medication_string(request.medication_string)
+@contextmanager
+def render_http_errors():
+    """Converte os erros do render_engine em respostas HTTP (503 com Retry-After e 504)."""
+    try:
+        yield
+    except RenderQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except RenderTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+def prescription_response(template, response_format, medications, pdf_bytes, history_id=None):
+    """
+    Monta a resposta do /prescribe no formato pedido em `response_format`; o
+    id da prescrição no histórico, se houver, vai no cabeçalho X-History-Id.
+    """
+    pdf_filename = TEMPLATE_FILENAMES[template]
+    headers = {} if history_id is None else {"X-History-Id": str(history_id)}
+    if response_format == "pdf":
+        return StreamingResponse(
+            iter_chunks(pdf_bytes),
+            media_type="application/pdf",
+            headers={"Content-Disposition": f'inline; filename="{pdf_filename}"', **headers},
+        )
+    # Serializado aqui (e não pelo FastAPI) para que o estágio "serialize" seja medido
+    if FAST_JSON:
+        body = fast_json_body(medications, pdf_filename, pdf_bytes)
+    else:
+        body = PrescriptionResponse.model_validate({
+            "medicacoes": medications,
+            "pdf_filename": pdf_filename,
+            "pdf_base64": base64.b64encode(pdf_bytes).decode("ascii"),
+        }, from_attributes=True).model_dump_json()
+    return Response(body, media_type="application/json", headers=headers)
+
+def fast_json_body(medications, pdf_filename, pdf_bytes):
+    """
+    O mesmo JSON de PrescriptionResponse.model_dump_json(), montado direto em
+    bytes: as medicações já vêm validadas do parser e o base64 não passa por str.
+    """
+    return b"".join((
+        b'{"medicacoes":', medparser.medications_json(medications).encode("utf-8"),
+        b',"pdf_filename":', json.dumps(pdf_filename, ensure_ascii=False).encode("utf-8"),
+        b',"pdf_base64":"', base64.b64encode(pdf_bytes), b'"}',
+    ))
+
+@app.post(
+    "/prescribe",
+    response_model=PrescriptionResponse,
+    responses={200: {"content": {"application/pdf": {}}}, 202: {"description": "Job criado (?async=1)"}},
+)
+async def prescribe(
+    request: PrescriptionRequest,
+    http_request: Request,
+    profile: bool = Query(False, description="Gera um perfil (cProfile) desta requisição; o id volta no cabeçalho X-Profile-Id."),
+    run_async: bool = Query(False, alias="async", description="Valida e faz o parsing agora e renderiza em segundo plano; responde 202 com o id do job."),
+):
+    if profile or http_request.headers.get(profiling.PROFILE_HEADER, "").lower() in ("1", "true"):
+        return await prescribe_profiled(request)
+    if run_async:
+        return await prescribe_async(request)
+
+    # Tempos por estágio, registrados em /metrics ao final (inclusive em erros)
+    timer = metrics.StageTimer()
+    timer.add("validation", request._validation_seconds)
+    template = metrics.template_label(request.template)
+    medication_count = 0
+    result = "error"
+    REQUESTS_IN_FLIGHT.inc("prescribe")
+    try:
+        with timer.stage("parse"):
+            medications, context = prepare_prescription(request)
+        medication_count = len(medications)
+
+        # O PDF é renderizado em memória, em um processo do render_engine, sem bloquear o event loop
+        with render_http_errors():
+            pdf_bytes = await render_cached(medications, context, timer.timings)
 
-    if "error" in parse_result:
-        raise HTTPException(status_code=400, detail=parse_result["error"])
+        with timer.stage("history"):
+            history_id = await record_history(medications, context, pdf_bytes)
 
-    medications = parse_result["medicacoes"]
+        with timer.stage("serialize"):
+            response = prescription_response(request.template, request.response_format, medications, pdf_bytes, history_id)
+        result = "ok"
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.dec("prescribe")
+        metrics.observe_stages(timer, template, medication_count)
+        metrics.PRESCRIPTIONS.inc(template, result)
 
-    # Temporariamente sobrescrever EMITTER_DATA para a geração do PDF
-    # Em uma API real, os dados do emitente seriam passados diretamente para a função de geração de PDF
-    # sem depender de uma variável global.
-    cli_parser.EMITTER_DATA = request.emitter_data.dict()
+async def prescribe_profiled(request):
+    """
+    /prescribe sob o cProfile: o parsing e a serialização são medidos aqui e a
+    renderização no worker, sempre sem passar pelo cache. Fica fora das
+    métricas, já que o profiler distorce os tempos.
+    """
+    profiler = profiling.Profiler()
+    with profiler:
+        medications, context = prepare_prescription(request)
+    with render_http_errors():
+        pdf_bytes = await render_engine.render_profiled(medications, context, profiler.partial_path())
+    history_id = await record_history(medications, context, pdf_bytes)
+    with profiler:
+        response = prescription_response(request.template, request.response_format, medications, pdf_bytes, history_id)
+    response.headers[profiling.PROFILE_ID_HEADER] = await asyncio.to_thread(profiler.save, "prescribe")
+    return response
 
-    pdf_filename = ""
-    if request.template == "memed":
-        pdf_filename = "prescricao_memed.pdf"
-        cli_parser.generate_memed_like_pdf(medications, filename=pdf_filename)
-    elif request.template == "simple":
-        pdf_filename = "prescricao_simple.pdf"
-        cli_parser.generate_simple_pdf(medications, filename=pdf_filename)
+async def prescribe_async(request):
+    """Erros de validação e parsing são respondidos na hora; a renderização vira um job."""
+    medications, context = prepare_prescription(request)
+    job_id = await asyncio.to_thread(job_queue.enqueue, medications, context)
+    job_runner.notify()
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}", "pdf_url": f"/jobs/{job_id}/pdf"},
+        headers={"Location": f"/jobs/{job_id}"},
+    )
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Estado de um job criado com POST /prescribe?async=1 (queued, running, done ou error)."""
+    try:
+        return await asyncio.to_thread(job_queue.get, job_id)
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado.")
+
+@app.get("/jobs/{job_id}/pdf", response_class=StreamingResponse, responses={200: {"content": {"application/pdf": {}}}})
+async def get_job_pdf(job_id: str):
+    """O PDF de um job concluído. Responde 409 enquanto o job não termina (ou se ele falhou)."""
+    try:
+        status, template, error, pdf_bytes = await asyncio.to_thread(job_queue.get_pdf, job_id)
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado.")
+    if status == "error":
+        raise HTTPException(status_code=409, detail=f"O job falhou: {error}")
+    if status != "done":
+        raise HTTPException(status_code=409, detail=f"O job ainda não terminou (status: {status}).", headers={"Retry-After": "1"})
+    return StreamingResponse(
+        iter_chunks(pdf_bytes),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'inline; filename="{TEMPLATE_FILENAMES[template]}"'},
+    )
+
+# Prescrição de exemplo usada no aquecimento dos workers
+WARMUP_REQUEST = {
+    "medication_string": "!MED DIPIRONA 500MG [COMPRIMIDO] 1 COMPRIMIDO A CADA 6 HORAS",
+    "emitter_data": {"nome": "Aquecimento", "crm": "0", "endereco": "", "telefone": "", "cidade_uf": ""},
+}
+
+async def warmup():
+    """
+    Passa uma prescrição de cada template por todo o caminho do /prescribe
+    (validação, parsing, renderização no pool e serialização), sem cache e
+    sem métricas, para que a primeira requisição real não pague importações e
+    caches frios.
+    """
+    for template in TEMPLATE_FILENAMES:
+        request = PrescriptionRequest.model_validate({**WARMUP_REQUEST, "template": template})
+        medications, context = prepare_prescription(request)
+        pdf_bytes = await render_engine.render(medications, context)
+        prescription_response(request.template, request.response_format, medications, pdf_bytes)
+
+# --- Lote de prescrições ---
+
+async def _batch_item(index, item, limit):
+    """
+    Processa um item do lote (dict ou linha NDJSON ainda não decodificada) e
+    devolve sua linha de resultado; erros nunca propagam.
+    """
+    timer = metrics.StageTimer()
+    template = "unknown"
+    medication_count = 0
+    result = "error"
+    try:
+        if isinstance(item, bytes):
+            item = json.loads(item)
+        request = PrescriptionRequest.model_validate(item)
+        timer.add("validation", request._validation_seconds)
+        template = metrics.template_label(request.template)
+        with timer.stage("parse"):
+            medications, context = prepare_prescription(request)
+        medication_count = len(medications)
+        async with limit:
+            pdf_bytes = await render_cached(medications, context, timer.timings)
+        with timer.stage("history"):
+            history_id = await record_history(medications, context, pdf_bytes, source="api-batch")
+        result = "ok"
+    except json.JSONDecodeError as e:
+        return {"index": index, "status": "error", "error": f"JSON inválido: {e}"}
+    except ValidationError as e:
+        return {"index": index, "status": "error", "error": e.errors(include_url=False, include_context=False)}
+    except HTTPException as e:
+        return {"index": index, "status": "error", "error": e.detail}
+    except (RenderQueueFull, RenderTimeout) as e:
+        return {"index": index, "status": "error", "error": str(e)}
+    except Exception as e:
+        return {"index": index, "status": "error", "error": f"Erro inesperado: {e}"}
+    finally:
+        metrics.observe_stages(timer, template, medication_count)
+        metrics.PRESCRIPTIONS.inc(template, result)
+
+    pdf_filename = TEMPLATE_FILENAMES[request.template]
+    return {
+        "index": index,
+        "status": "ok",
+        "history_id": history_id,
+        "medicacoes": medications,
+        "pdf_filename": pdf_filename,
+        "pdf_base64": base64.b64encode(pdf_bytes).decode("ascii"),
+    }
+
+async def _iter_ndjson_lines(stream):
+    buffer = b""
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    yield buffer
+
+@app.post(
+    "/prescribe/batch",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/PrescriptionRequest"}}},
+        "application/x-ndjson": {"schema": {"$ref": "#/components/schemas/PrescriptionRequest"}},
+    }}},
+)
+async def prescribe_batch(http_request: Request):
+    """
+    Recebe uma lista JSON ou um stream NDJSON de PrescriptionRequest e devolve
+    uma linha NDJSON por item, na ordem em que cada um termina. O campo
+    `index` indica a posição do item na entrada; um item com erro gera uma
+    linha com status "error" sem interromper o restante do lote.
+    """
+    # Limita quantos itens do lote ocupam o render_engine ao mesmo tempo,
+    # deixando espaço na fila para as requisições individuais
+    limit = asyncio.Semaphore(max(1, min(render_engine.workers, render_engine.max_pending // 2)))
+    tasks = []
+
+    if "ndjson" in http_request.headers.get("content-type", ""):
+        # Cada linha começa a ser processada assim que chega, antes do fim do corpo
+        async for line in _iter_ndjson_lines(http_request.stream()):
+            if line.strip():
+                tasks.append(asyncio.ensure_future(_batch_item(len(tasks), line, limit)))
     else:
-        raise HTTPException(status_code=400, detail=f"Template desconhecido: {request.template}")
+        try:
+            items = await http_request.json()
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"JSON inválido: {e}")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="O corpo deve ser uma lista de prescrições ou NDJSON.")
+        tasks = [asyncio.ensure_future(_batch_item(i, item, limit)) for i, item in enumerate(items)]
+
+    async def results():
+        REQUESTS_IN_FLIGHT.inc("batch")
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                yield json.dumps(result, ensure_ascii=False, default=medparser.json_default) + "\n"
+        finally:
+            # Cliente desconectou: não renderizar o que ainda falta
+            for task in tasks:
+                task.cancel()
+            REQUESTS_IN_FLIGHT.dec("batch")
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+# --- Várias prescrições em um único PDF ---
+
+async def _render_pages_when_free(medications, context):
+    # Com a resposta já começada, não dá mais para responder 503: espera uma vaga na fila
+    while True:
+        try:
+            return await render_engine.render_pages(medications, context)
+        except RenderQueueFull:
+            await asyncio.sleep(0.05)
+
+@app.post("/prescribe/merged", response_class=StreamingResponse, responses={200: {"content": {"application/pdf": {}}}})
+async def prescribe_merged(requests: List[PrescriptionRequest]):
+    """
+    Gera um único PDF com todas as prescrições da lista, cada uma com seu
+    emitente e paciente e começando em uma página nova. Todas são validadas
+    antes de a resposta começar (um item inválido gera 400 com o seu índice);
+    o PDF é enviado à medida que as páginas ficam prontas. Com a resposta já
+    começada, um item cuja renderização falha (ex.: tempo esgotado) vira uma
+    página de erro com o seu índice, e o erro é registrado no log.
+    """
+    prepared = []
+    for index, request in enumerate(requests):
+        try:
+            prepared.append(prepare_prescription(request))
+        except HTTPException as e:
+            raise HTTPException(status_code=400, detail=f"Item {index}: {e.detail}")
+
+    # Renderiza alguns itens adiante nos processos do render_engine, mas grava na ordem da lista
+    window = max(1, min(render_engine.workers, render_engine.max_pending // 2))
+
+    async def pdf_chunks():
+        chunks = []
+        writer = MergedPdfWriter(chunks.append)
+        pending = collections.deque()
+        rendered = []
+
+        async def add_next():
+            index, task = pending.popleft()
+            try:
+                pages = await task
+            except Exception as e:
+                logger.exception("Falha ao renderizar o item %d do PDF combinado", index)
+                pages = error_pages(f"Item {index}: {str(e) or type(e).__name__}")
+            else:
+                rendered.append(prepared[index])
+            writer.add_pages(pages)
+
+        REQUESTS_IN_FLIGHT.inc("merged")
+        try:
+            for index, (medications, context) in enumerate(prepared):
+                pending.append((index, asyncio.ensure_future(_render_pages_when_free(medications, context))))
+                if len(pending) >= window:
+                    await add_next()
+                    yield b"".join(chunks)
+                    chunks.clear()
+            while pending:
+                await add_next()
+                yield b"".join(chunks)
+                chunks.clear()
+            writer.close()
+            yield b"".join(chunks)
+            if history.enabled and rendered:
+                try:
+                    await asyncio.to_thread(history.record_many, [
+                        {"medications": medications, "context": context, "source": "api-merged"}
+                        for medications, context in rendered
+                    ])
+                except Exception:
+                    logger.exception("Falha ao gravar o PDF combinado no histórico")
+        finally:
+            # Cliente desconectou: não renderizar o que ainda falta
+            for _, task in pending:
+                task.cancel()
+            REQUESTS_IN_FLIGHT.dec("merged")
+
+    return StreamingResponse(
+        pdf_chunks(),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'inline; filename="prescricoes.pdf"'},
+    )
+
+# --- Pré-visualização ao vivo ---
+
+async def _preview_render(session, message):
+    """Renderiza o estado atual da sessão (mensagem "render") e retorna a mensagem de resposta."""
+    if session.error or session.has_item_errors:
+        return {"type": "render_error", "version": session.version, "error": session.error or "A string tem itens inválidos."}
+    try:
+        request = PreviewRenderMessage.model_validate(message)
+        if request.template not in TEMPLATE_FILENAMES:
+            raise ValueError(f"Template desconhecido: {request.template}")
+        context = cli_parser.RenderContext(
+            emitter=request.emitter_data.model_dump(),
+            template=request.template,
+            **({"patient": request.patient_data.model_dump()} if request.patient_data else {}),
+        )
+        pdf_bytes = await render_cached(session.medications, context)
+    except ValidationError as e:
+        return {"type": "render_error", "version": session.version, "error": e.errors(include_url=False, include_context=False)}
+    except (ValueError, RenderQueueFull, RenderTimeout) as e:
+        return {"type": "render_error", "version": session.version, "error": str(e)}
+    except Exception:
+        # Um erro inesperado não encerra a sessão: o editor continua mandando atualizações
+        logger.exception("Falha ao renderizar a pré-visualização")
+        return {"type": "render_error", "version": session.version, "error": "Erro interno ao gerar o PDF."}
+    return {
+        "type": "pdf",
+        "version": session.version,
+        "pdf_filename": TEMPLATE_FILENAMES[request.template],
+        "pdf_base64": base64.b64encode(pdf_bytes).decode("ascii"),
+    }
+
+@app.websocket("/preview")
+async def preview(websocket: WebSocket):
+    """
+    Pré-visualização para editores (live_preview.py). Mensagens JSON do cliente:
+        {"type": "update", "text": "!MED ..."}  -> diferença dos itens desde a última versão
+        {"type": "snapshot"}                    -> estado completo
+        {"type": "render", "template": ..., "emitter_data": {...}, "patient_data": {...}}
+                                                -> PDF (base64) da versão atual
+    Só a mensagem "render" gera um PDF.
+    """
+    await websocket.accept()
+    session = PreviewSession()
+    PREVIEW_SESSIONS.inc()
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            try:
+                message = json.loads(frame["text"]) # Frames binários não têm "text"
+                kind = message.get("type")
+            except (KeyError, TypeError, json.JSONDecodeError, AttributeError):
+                await websocket.send_json({"type": "error", "error": "Mensagem deve ser um objeto JSON (frame de texto)."})
+                continue
+            if kind == "update":
+                if isinstance(message.get("text"), str):
+                    await websocket.send_json(session.update(message["text"]))
+                else:
+                    await websocket.send_json({"type": "error", "error": 'O campo "text" da mensagem "update" deve ser uma string.'})
+            elif kind == "snapshot":
+                await websocket.send_json(session.snapshot())
+            elif kind == "render":
+                await websocket.send_json(await _preview_render(session, message))
+            else:
+                await websocket.send_json({"type": "error", "error": f"Mensagem desconhecida: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        PREVIEW_SESSIONS.dec()
+
+@app.get("/drugs/suggest")
+async def suggest_drugs(
+    q: str = Query(..., min_length=1, description="Início do nome do medicamento (acentos e maiúsculas são ignorados)."),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """Nomes do catálogo de medicamentos que começam com `q`, para autocompletar."""
+    catalog = drug_catalog.default_catalog()
+    return {"query": q, "catalog_version": catalog.version, "suggestions": catalog.suggest(q, limit)}
+
+# --- Histórico de prescrições ---
+
+@app.get("/history")
+async def list_history(
+    patient: Optional[str] = Query(None, description="Início do nome do paciente (sem diferença de acentos ou de caixa)."),
+    cpf: Optional[str] = Query(None, description="CPF do paciente (com ou sem pontuação)."),
+    crm: Optional[str] = Query(None, description="CRM do emitente."),
+    drug: Optional[str] = Query(None, description="Início do nome de uma das medicações."),
+    since: Optional[date] = Query(None, description="Emitidas a partir desta data (AAAA-MM-DD)."),
+    until: Optional[date] = Query(None, description="Emitidas até esta data, inclusive (AAAA-MM-DD)."),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Prescrições emitidas que atendem a todos os filtros, da mais recente para a mais antiga."""
+    prescriptions = await asyncio.to_thread(
+        history.search, patient=patient, cpf=cpf, crm=crm, drug=drug, since=since, until=until, limit=limit,
+    )
+    return {"prescriptions": prescriptions}
+
+@app.get("/history/{prescription_id}")
+async def get_history_entry(prescription_id: int):
+    try:
+        return await asyncio.to_thread(history.get, prescription_id)
+    except HistoryNotFound:
+        raise HTTPException(status_code=404, detail="Prescrição não encontrada no histórico.")
+
+@app.post("/history/{prescription_id}/repeat", responses={200: {"content": {"application/pdf": {}}}})
+async def repeat_prescription(
+    prescription_id: int,
+    template: Optional[str] = Query(None, description="Outro template (padrão: o da prescrição original)."),
+    response_format: Literal["json", "pdf"] = "json",
+):
+    """
+    Emite de novo uma prescrição do histórico, com a data de hoje. Se nada
+    mudou desde uma emissão anterior, o PDF vem do cache sem renderizar.
+    """
+    try:
+        entry = await asyncio.to_thread(history.get, prescription_id)
+    except HistoryNotFound:
+        raise HTTPException(status_code=404, detail="Prescrição não encontrada no histórico.")
+    if template is not None and template not in TEMPLATE_FILENAMES:
+        raise HTTPException(status_code=400, detail=f"Template desconhecido: {template}")
+
+    medications = entry["medicacoes"]
+    context = entry_context(entry, template=template)
+    with render_http_errors():
+        pdf_bytes = await render_cached(medications, context)
+    history_id = await record_history(medications, context, pdf_bytes, source="api-repeat", repeated_from=prescription_id)
+    return prescription_response(context.template, response_format, medications, pdf_bytes, history_id)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return pdf_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Métricas no formato texto do Prometheus (tempos por estágio, fila, cache)."""
+    try:
+        JOBS_PENDING.set(await asyncio.to_thread(job_queue.pending))
+    except Exception:
+        logger.exception("Falha ao contar os jobs pendentes") # Expõe o último valor
+    return PlainTextResponse(metrics.REGISTRY.expose(), media_type=metrics.CONTENT_TYPE)
 
-    # Limpar EMITTER_DATA após o uso para evitar vazamento de estado entre requisições
-    cli_parser.EMITTER_DATA = {}
+@app.get("/profiles")
+async def list_profiles():
+    """Perfis gerados com ?profile=1 ou X-Profile: 1, do mais recente para o mais antigo."""
+    return profiling.list_profiles()
 
-    return PrescriptionResponse(medicacoes=medications, pdf_filename=pdf_filename)
+@app.get("/profiles/{profile_id}", responses={200: {"content": {"application/octet-stream": {}, "text/plain": {}}}})
+async def get_profile(profile_id: str, format: Literal["pstats", "text"] = "pstats", sort: str = "cumulative"):
+    """Baixa o arquivo pstats do perfil ou, com format=text, um resumo das funções mais caras."""
+    try:
+        path = profiling.profile_path(profile_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado.")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Perfil não encontrado.")
+    if format == "text":
+        try:
+            return PlainTextResponse(await asyncio.to_thread(profiling.summary, profile_id, sort))
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Ordenação desconhecida: {sort}")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.pstats")
 
 # --- Para executar o servidor (não faz parte do arquivo api_server.py, mas é como você o iniciaria) ---
 # uvicorn api_server:app --reload --port 8000
@@ -0,0 +1 @@
+"""Benchmarks do PrescreveAI: `python -m benchmarks <micro|api|startup|compare>`."""
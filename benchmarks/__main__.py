@@ -0,0 +1,21 @@
+"""
+python -m benchmarks <suíte> [opções]
+
+Suítes: micro, alloc, api, startup e compare (veja `python -m benchmarks <suíte> --help`).
+"""
+import importlib
+import sys
+
+SUITES = ("micro", "alloc", "api", "startup", "compare")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in SUITES:
+        print(__doc__.strip())
+        return 2
+    return importlib.import_module(f"benchmarks.{argv[0]}").main(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
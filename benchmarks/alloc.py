@@ -0,0 +1,121 @@
+"""
+Alocações por requisição no caminho da resposta JSON do /prescribe (parsing e
+montagem da resposta, sem a renderização: o PDF de cada tamanho é gerado uma
+vez e reaproveitado), com 1, 10 e 200 medicações:
+
+    dicts    dicts de parse_medication_string validados de novo pelo PrescriptionResponse
+             (o caminho anterior aos registros Medication)
+    records  registros medparser.Medication validados pelo PrescriptionResponse (padrão da API)
+    fast     registros serializados direto em bytes (PRESCREVEAI_FAST_JSON=1)
+
+Além da latência, cada caso reporta, medidos com o tracemalloc em chamadas à
+parte, o pico de memória alocada durante uma requisição (peak_alloc_kb) e o
+que continua alocado no resultado, medicações e corpo (retained_kb). Com
+poucas medicações, a lista livre de dicts do CPython reaproveita dicts já
+alocados e esconde parte do custo do caminho "dicts"; a diferença aparece com
+200 medicações.
+
+Uso:
+    python -m benchmarks alloc [--scale 1.0] [--output alloc.json] [FILTRO ...]
+"""
+import argparse
+import base64
+import sys
+import tracemalloc
+
+from benchmarks import harness
+from benchmarks.fixtures import ISSUE_DATE, SAMPLE_EMITTER, SIZES, medication_string
+
+ITERATIONS = {1: 20000, 10: 5000, 200: 300}
+
+# Chamadas medidas com o tracemalloc (o menor valor é o reportado)
+ALLOCATION_REPEAT = 5
+
+
+def measure_allocations(fn, repeat=ALLOCATION_REPEAT):
+    """Pico de memória alocada durante `fn()` e memória retida pelo resultado, em KB."""
+    fn() # Caches do regex e do pydantic já aquecidos
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(repeat):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            result = fn()
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+            del result
+    finally:
+        tracemalloc.stop()
+    return {"peak_alloc_kb": min(peaks) / 1024, "retained_kb": min(retained) / 1024}
+
+
+def _cases():
+    import api_server
+    import medparser
+    import prescreveai
+    from pdf_render import render_pdf
+    from render_context import RenderContext
+
+    response_model = api_server.PrescriptionResponse
+    filename = "prescricao_memed.pdf"
+    for size in SIZES:
+        text = medication_string(size)
+        context = RenderContext(emitter=SAMPLE_EMITTER, template="memed", issue_date=ISSUE_DATE)
+        pdf_bytes = render_pdf(medparser.parse(text).medications, context)
+
+        def dicts(text=text, pdf_bytes=pdf_bytes):
+            medications = prescreveai.parse_medication_string(text)["medicacoes"]
+            return medications, response_model(
+                medicacoes=medications,
+                pdf_filename=filename,
+                pdf_base64=base64.b64encode(pdf_bytes).decode("ascii"),
+            ).model_dump_json()
+
+        def records(text=text, pdf_bytes=pdf_bytes):
+            medications = medparser.parse(text).medications
+            return medications, response_model.model_validate({
+                "medicacoes": medications,
+                "pdf_filename": filename,
+                "pdf_base64": base64.b64encode(pdf_bytes).decode("ascii"),
+            }, from_attributes=True).model_dump_json()
+
+        def fast(text=text, pdf_bytes=pdf_bytes):
+            medications = medparser.parse(text).medications
+            return medications, api_server.fast_json_body(medications, filename, pdf_bytes)
+
+        for name, fn in (("dicts", dicts), ("records", records), ("fast", fast)):
+            yield f"response[{name},{size}]", ITERATIONS[size], fn
+
+
+def run(scale=1.0, filters=()):
+    results = {}
+    for name, iterations, fn in _cases():
+        if filters and not any(f in name for f in filters):
+            continue
+        results[name] = harness.measure(fn, max(1, int(iterations * scale)))
+        results[name].update(measure_allocations(fn))
+    return harness.report("alloc", results, scale=scale)
+
+
+def print_allocations(results, file=sys.stderr):
+    for name, r in results.items():
+        print(f"{name:<28} p50 {r['p50_ms']:8.3f} ms  pico {r['peak_alloc_kb']:9.1f} KB  retido {r['retained_kb']:9.1f} KB", file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks alloc", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplica o número de iterações (padrão: 1.0)")
+    parser.add_argument("--output", help="grava o relatório JSON neste arquivo")
+    parser.add_argument("filters", nargs="*", metavar="FILTRO", help="roda só os casos cujo nome contém algum filtro")
+    options = parser.parse_args(argv)
+
+    data = run(options.scale, options.filters)
+    print_allocations(data["results"])
+    harness.write_report(data, options.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
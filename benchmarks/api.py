@@ -0,0 +1,97 @@
+"""
+Benchmarks de ponta a ponta do POST /prescribe, em processo, pelo TestClient
+do FastAPI (ASGI, sem rede). Inclui o pool de renderização do render_engine e
+o cache de PDFs: os casos sem cache variam o emitente a cada requisição para
+nunca acertar o cache; o caso "cached" repete sempre a mesma requisição.
+
+Uso:
+    python -m benchmarks api [--workers 2] [--scale 1.0] [--output api.json] [FILTRO ...]
+
+Requer o httpx (dependência do TestClient do FastAPI).
+"""
+import argparse
+import itertools
+import os
+import resource
+import sys
+import tempfile
+
+from benchmarks import harness
+from benchmarks.fixtures import SAMPLE_EMITTER, medication_string
+
+# nome -> (medicações, response_format, repetir a mesma requisição, iterações)
+CASES = {
+    "prescribe[json,1]": (1, "json", False, 300),
+    "prescribe[json,10]": (10, "json", False, 200),
+    "prescribe[json,200]": (200, "json", False, 30),
+    "prescribe[pdf,10]": (10, "pdf", False, 200),
+    "prescribe[cached,10]": (10, "json", True, 1000),
+}
+
+# Compartilhado entre os casos: nenhum caso sem cache reaproveita PDFs de outro
+_unique = itertools.count()
+
+
+def _request_factory(size, response_format, repeat):
+    body = {
+        "medication_string": medication_string(size),
+        "emitter_data": SAMPLE_EMITTER,
+        "template": "memed",
+        "response_format": response_format,
+    }
+    if repeat:
+        return lambda: body
+    return lambda: {**body, "emitter_data": {**SAMPLE_EMITTER, "crm": f"{next(_unique)} RJ"}}
+
+
+def run(workers=2, scale=1.0, filters=()):
+    try:
+        from fastapi.testclient import TestClient
+    except (ImportError, RuntimeError) as e: # O TestClient levanta RuntimeError sem o httpx
+        raise SystemExit(f"benchmarks.api precisa do httpx: {e}")
+
+    # O pool e o cache leem a configuração ao importar o api_server
+    os.environ["PRESCREVEAI_RENDER_WORKERS"] = str(workers)
+    os.environ["PRESCREVEAI_CACHE_DIR"] = ""
+    # O registro no histórico continua sendo medido, mas em um banco descartável;
+    # a fila de jobs também, para o JobRunner do lifespan não pegar jobs reais
+    data_dir = tempfile.TemporaryDirectory()
+    os.environ["PRESCREVEAI_HISTORY_DB"] = os.path.join(data_dir.name, "history.sqlite3")
+    os.environ["PRESCREVEAI_JOBS_DB"] = os.path.join(data_dir.name, "jobs.sqlite3")
+    import api_server
+
+    results = {}
+    with TestClient(api_server.app) as client: # Executa o lifespan: sobe e aquece o pool
+        for name, (size, response_format, repeat, iterations) in CASES.items():
+            if filters and not any(f in name for f in filters):
+                continue
+            next_body = _request_factory(size, response_format, repeat)
+
+            def call():
+                response = client.post("/prescribe", json=next_body())
+                if response.status_code != 200:
+                    raise RuntimeError(f"{name}: HTTP {response.status_code}: {response.text[:200]}")
+
+            results[name] = harness.measure(call, max(1, int(iterations * scale)))
+    # Os workers já terminaram: RUSAGE_CHILDREN traz o maior pico entre eles
+    workers_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    data_dir.cleanup()
+    return harness.report("api", results, workers=workers, scale=scale, worker_peak_rss_kb=workers_peak)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks api", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2, help="processos do pool de renderização (padrão: 2)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplica o número de iterações (padrão: 1.0)")
+    parser.add_argument("--output", help="grava o relatório JSON neste arquivo")
+    parser.add_argument("filters", nargs="*", metavar="FILTRO", help="roda só os casos cujo nome contém algum filtro")
+    options = parser.parse_args(argv)
+
+    data = run(options.workers, options.scale, options.filters)
+    harness.print_results(data["results"])
+    harness.write_report(data, options.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
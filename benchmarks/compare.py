@@ -0,0 +1,93 @@
+"""
+Compara um relatório de benchmark com uma baseline e aponta regressões.
+
+Uso:
+    python -m benchmarks compare ATUAL.json [BASELINE.json] [--threshold 0.10] [--metric p50_ms ...]
+
+Sem BASELINE, usa benchmarks/baselines/<suite>.json. Métricas terminadas em
+"_per_s" são melhores quanto maiores; as demais, quanto menores. Termina com
+código 1 se alguma métrica piorar mais que o limite.
+"""
+import argparse
+import json
+import os
+import sys
+
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+DEFAULT_METRICS = {
+    "micro": ("p50_ms", "p95_ms"),
+    "alloc": ("peak_alloc_kb", "retained_kb", "p50_ms"),
+    "api": ("p50_ms", "p95_ms", "throughput_per_s"),
+    "startup": ("wall_ms", "import_ms"),
+}
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(baseline, current, metrics, threshold):
+    """
+    Retorna uma linha por (caso, métrica) presente nos dois relatórios:
+    {"case", "metric", "baseline", "current", "change", "regression"}.
+    `change` é a variação relativa, positiva quando o resultado piorou.
+    """
+    rows = []
+    for case, current_metrics in current["results"].items():
+        baseline_metrics = baseline["results"].get(case)
+        if baseline_metrics is None:
+            continue
+        for metric in metrics:
+            if metric not in baseline_metrics or metric not in current_metrics:
+                continue
+            old, new = baseline_metrics[metric], current_metrics[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if metric.endswith("_per_s"):
+                change = -change
+            rows.append({
+                "case": case,
+                "metric": metric,
+                "baseline": old,
+                "current": new,
+                "change": change,
+                "regression": change > threshold,
+            })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks compare", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("current", help="relatório JSON a verificar")
+    parser.add_argument("baseline", nargs="?", help="relatório de referência (padrão: benchmarks/baselines/<suite>.json)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora relativa tolerada (padrão: 0.10 = 10%%)")
+    parser.add_argument("--metric", action="append", dest="metrics", help="métrica a comparar (pode repetir)")
+    options = parser.parse_args(argv)
+
+    current = load(options.current)
+    suite = current.get("suite")
+    baseline_path = options.baseline or os.path.join(BASELINES_DIR, f"{suite}.json")
+    baseline = load(baseline_path)
+    if baseline.get("suite") != suite:
+        parser.error(f"suítes diferentes: {baseline.get('suite')} (baseline) x {suite} (atual)")
+
+    metrics = options.metrics or DEFAULT_METRICS.get(suite, ("p50_ms",))
+    rows = compare(baseline, current, metrics, options.threshold)
+    for row in rows:
+        flag = "REGRESSÃO" if row["regression"] else "ok"
+        print(f"{row['case']:<28} {row['metric']:<18} {row['baseline']:12.3f} -> {row['current']:12.3f}  "
+              f"{row['change']:+7.1%}  {flag}")
+
+    missing = sorted(set(baseline["results"]) - set(current["results"]))
+    if missing:
+        print(f"Casos da baseline ausentes no relatório atual: {', '.join(missing)}")
+    regressions = [row for row in rows if row["regression"]]
+    print(f"{len(regressions)} regressão(ões) acima de {options.threshold:.0%} em relação a {baseline_path}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
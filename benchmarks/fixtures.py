@@ -0,0 +1,35 @@
+"""Entradas determinísticas usadas pelos benchmarks."""
+from datetime import date
+
+SIZES = (1, 10, 200)
+
+SAMPLE_EMITTER = {
+    "nome": "Dr. Exemplo da Silva",
+    "crm": "123456 RJ",
+    "endereco": "Rua Exemplo, 100",
+    "telefone": "(21) 99999-0000",
+    "cidade_uf": "Rio de Janeiro - RJ",
+}
+
+# Data fixa: o conteúdo do PDF (e a chave do cache) não muda de um dia para outro
+ISSUE_DATE = date(2025, 1, 15)
+
+_ITEMS = (
+    "Dipirona {dose}mg 1 comprimido a cada 6 horas se dor ou febre",
+    "Amoxicilina {dose}mg [uso oral] 1 cápsula a cada 8 horas por 7 dias",
+    "Losartana {dose}mg 1 comprimido pela manhã",
+    "Clonazepam {dose}mg/ml [gotas] 10 gotas à noite",
+    "Vitamina D {dose}UI 1 cápsula por semana",
+)
+
+
+def medication_string(count):
+    """String !MED com `count` itens (com e sem comentário, unidades variadas)."""
+    items = [_ITEMS[i % len(_ITEMS)].format(dose=25 * (i + 1)) for i in range(count)]
+    return "!MED " + "; ".join(items)
+
+
+def medications(count):
+    """Lista de medicações já parseada, como a que chega aos geradores de PDF."""
+    import medparser
+    return medparser.parse(medication_string(count)).medications
@@ -0,0 +1,83 @@
+"""
+Medição comum aos benchmarks: repete uma função, coleta a latência de cada
+chamada e resume em vazão, percentis e pico de memória.
+
+Os relatórios têm o formato
+    {"suite": ..., "python": ..., "machine": ..., "results": {caso: métricas}}
+e podem ser comparados com `python -m benchmarks compare`.
+"""
+import json
+import platform
+import resource
+import sys
+import time
+
+
+def peak_rss_kb():
+    """Pico de memória residente do processo atual, em KB (ru_maxrss; bytes no macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def percentile(sorted_values, fraction):
+    """Percentil por interpolação linear de uma lista já ordenada."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "iterations": len(latencies),
+        "throughput_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+        # ru_maxrss só cresce: é o pico do processo até o fim deste caso
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def measure(fn, iterations, warmup=None):
+    """Executa `fn()` `warmup` vezes sem medir e `iterations` vezes medindo cada chamada."""
+    for _ in range(warmup if warmup is not None else max(1, iterations // 10)):
+        fn()
+    clock = time.perf_counter
+    latencies = []
+    start = clock()
+    for _ in range(iterations):
+        t0 = clock()
+        fn()
+        latencies.append(clock() - t0)
+    return summarize(latencies, clock() - start)
+
+
+def report(suite, results, **extra):
+    return {
+        "suite": suite,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        **extra,
+        "results": results,
+    }
+
+
+def print_results(results, file=sys.stderr):
+    for name, r in results.items():
+        print(f"{name:<28} {r['throughput_per_s']:10.1f}/s  p50 {r['p50_ms']:8.3f} ms  "
+              f"p95 {r['p95_ms']:8.3f} ms  p99 {r['p99_ms']:8.3f} ms  rss {r['peak_rss_kb'] / 1024:6.1f} MB", file=file)
+
+
+def write_report(data, output=None):
+    text = json.dumps(data, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,77 @@
+"""
+Microbenchmarks do parser, do formatador e dos dois templates de PDF, com 1,
+10 e 200 medicações (200 medicações percorrem o caminho de várias páginas), e
+da busca por prefixo no catálogo de medicamentos.
+
+Uso:
+    python -m benchmarks micro [--scale 1.0] [--output micro.json] [FILTRO ...]
+
+FILTRO seleciona os casos cujo nome contém o texto (ex.: "memed", "[200]").
+"""
+import argparse
+import re
+import sys
+
+from benchmarks import harness
+from benchmarks.fixtures import ISSUE_DATE, SAMPLE_EMITTER, SIZES, medication_string, medications
+
+# Iterações por número de medicações, antes de --scale
+TEXT_ITERATIONS = {1: 20000, 10: 5000, 200: 300}
+PDF_ITERATIONS = {1: 300, 10: 200, 200: 20}
+SUGGEST_ITERATIONS = 20000
+
+# Consultas de autocompletar: uma letra (muitos candidatos), um prefixo comum e
+# o início de uma palavra no meio do nome
+SUGGEST_QUERIES = ("a", "levo", "clavul")
+
+_PAGE_OBJECT = re.compile(rb"/Type /Page\b(?!s)")
+
+
+def _cases():
+    import prescreveai
+    import pdf_render
+    from medparser import format_medication_text
+    from render_context import RenderContext
+
+    for size in SIZES:
+        text = medication_string(size)
+        meds = medications(size)
+        yield f"parse[{size}]", TEXT_ITERATIONS[size], lambda text=text: prescreveai.parse_medication_string(text)
+        yield f"format[{size}]", TEXT_ITERATIONS[size], lambda meds=meds: [format_medication_text(m) for m in meds]
+        for template, generate in (("memed", pdf_render.generate_memed_like_pdf), ("simple", pdf_render.generate_simple_pdf)):
+            context = RenderContext(emitter=SAMPLE_EMITTER, template=template, issue_date=ISSUE_DATE)
+            yield f"{template}[{size}]", PDF_ITERATIONS[size], lambda g=generate, m=meds, c=context: g(m, filename=None, context=c)
+
+    import drug_catalog
+    catalog = drug_catalog.default_catalog().load()
+    for query in SUGGEST_QUERIES:
+        yield f"suggest[{query}]", SUGGEST_ITERATIONS, lambda q=query: catalog.suggest(q)
+
+
+def run(scale=1.0, filters=()):
+    import pdf_render
+    results = {}
+    for name, iterations, fn in _cases():
+        if filters and not any(f in name for f in filters):
+            continue
+        results[name] = harness.measure(fn, max(1, int(iterations * scale)))
+        if name.startswith(tuple(pdf_render.PDF_TEMPLATES)):
+            results[name]["pages"] = len(_PAGE_OBJECT.findall(fn()))
+    return harness.report("micro", results, scale=scale)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks micro", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplica o número de iterações (padrão: 1.0)")
+    parser.add_argument("--output", help="grava o relatório JSON neste arquivo")
+    parser.add_argument("filters", nargs="*", metavar="FILTRO", help="roda só os casos cujo nome contém algum filtro")
+    options = parser.parse_args(argv)
+
+    data = run(options.scale, options.filters)
+    harness.print_results(data["results"])
+    harness.write_report(data, options.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
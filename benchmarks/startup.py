@@ -0,0 +1,106 @@
+"""
+Tempo de partida a frio de cada subcomando do prescreveai.
+
+Cada subcomando é executado em um interpretador novo com `python -X importtime`;
+o relatório traz o tempo total do processo, o tempo gasto em imports (soma da
+coluna "self" do importtime), o número de módulos importados e se o reportlab
+foi carregado. Só os comandos que geram PDF deveriam importar o reportlab.
+
+Uso:
+    python -m benchmarks startup [--repeat 5] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import harness
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINT = os.path.join(ROOT_DIR, "prescreveai.py")
+
+SAMPLE_MEDICATION = "!MED Dipirona 500mg 1 comprimido a cada 6 horas"
+SAMPLE_RECORD = json.dumps({"medication_string": SAMPLE_MEDICATION, "template": "simple"})
+
+# nome -> (argumentos, entrada padrão)
+COMMANDS = {
+    "status": (["status"], ""),
+    "stop": (["stop"], ""),
+    "install": (["install"], ""),
+    "daemon status": (["daemon", "status"], ""),
+    "parse": ([], f"{SAMPLE_MEDICATION}\nexit\n"),
+    "batch": (["batch", "-", "--jobs", "1", "--output-dir", "{output_dir}"], SAMPLE_RECORD + "\n"),
+}
+
+
+def parse_importtime(stderr):
+    """Soma a coluna "self" (µs) das linhas do -X importtime. Retorna (µs, nomes dos módulos)."""
+    total_us = 0
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        total_us += int(self_us)
+        modules.append(name.strip())
+    return total_us, modules
+
+
+def measure(args, stdin, env):
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", ENTRY_POINT, *args],
+        input=stdin, capture_output=True, text=True, cwd=ROOT_DIR, env=env,
+    )
+    wall = time.perf_counter() - start
+    import_us, modules = parse_importtime(completed.stderr)
+    return {
+        "wall_ms": wall * 1000,
+        "import_ms": import_us / 1000,
+        "modules": len(modules),
+        "reportlab": any(name == "reportlab" or name.startswith("reportlab.") for name in modules),
+        "returncode": completed.returncode,
+    }
+
+
+def run(repeat=5, commands=None):
+    """Mede cada subcomando `repeat` vezes e guarda a melhor execução (menor tempo total)."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = dict(os.environ)
+        # Um daemon rodando mudaria o caminho medido; aponta o cliente para um socket inexistente
+        env["PRESCREVEAI_SOCKET"] = os.path.join(tmp_dir, "nenhum.sock")
+        # O `batch` grava no histórico: usa um banco temporário, e não o do programa
+        env["PRESCREVEAI_HISTORY_DB"] = os.path.join(tmp_dir, "history.sqlite3")
+        for name in commands or COMMANDS:
+            args, stdin = COMMANDS[name]
+            args = [arg.format(output_dir=tmp_dir) for arg in args]
+            runs = [measure(args, stdin, env) for _ in range(repeat)]
+            results[name] = min(runs, key=lambda r: r["wall_ms"])
+    return harness.report("startup", results, repeat=repeat)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks startup", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="execuções por subcomando (padrão: 5)")
+    parser.add_argument("--output", help="grava o relatório JSON neste arquivo")
+    parser.add_argument("commands", nargs="*", metavar="COMANDO",
+                        help=f"subcomandos a medir (padrão: todos; {', '.join(COMMANDS)})")
+    options = parser.parse_args(argv)
+    unknown = [name for name in options.commands if name not in COMMANDS]
+    if unknown:
+        parser.error(f"subcomando desconhecido: {', '.join(unknown)}")
+
+    report = run(options.repeat, options.commands)
+    for name, result in report["results"].items():
+        print(f"{name:<15} {result['wall_ms']:8.1f} ms total  {result['import_ms']:8.1f} ms em imports  "
+              f"{result['modules']:4d} módulos  reportlab={'sim' if result['reportlab'] else 'não'}", file=sys.stderr)
+    harness.write_report(report, options.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Catálogo local de medicamentos, com busca por prefixo para autocompletar.
+
+O catálogo é um arquivo de dados versionado (catalog/medicamentos.tsv: nome
+genérico e grafias alternativas) carregado só no primeiro uso, para não pesar
+na partida da CLI. Ao carregar, todos os nomes e sinônimos são normalizados
+(maiúsculas, sem acentos, espaços simples) e guardados em listas ordenadas; a
+busca é um bisect no prefixo seguido de uma varredura curta:
+
+    suggest("acido fo")    -> ["ÁCIDO FÓLICO"]
+    suggest("acetil")      -> ["ACETILCISTEÍNA", "ÁCIDO ACETILSALICÍLICO"]
+    canonical("metamizol") -> "DIPIRONA"
+
+As sugestões vêm primeiro pelo início do nome (ou de um sinônimo) e depois
+pelo início de qualquer outra palavra do nome, cada grupo em ordem alfabética
+(ignorando acentos).
+
+Configuração por variável de ambiente:
+    PRESCREVEAI_DRUG_CATALOG  arquivo do catálogo (padrão: catalog/medicamentos.tsv)
+"""
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+
+DEFAULT_CATALOG = os.environ.get("PRESCREVEAI_DRUG_CATALOG") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "catalog", "medicamentos.tsv")
+
+_VERSION_LINE = re.compile(r"^#\s*versao:\s*(\S+)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text):
+    """Chave de busca: maiúsculas, sem acentos e com espaços simples."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _SPACES.sub(" ", stripped).strip().upper()
+
+
+class DrugCatalog:
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_CATALOG
+        self.version = None
+        self._lock = threading.Lock()
+        self._loaded = False
+        # Índices paralelos ordenados: chave normalizada -> posição em self._names
+        self._prefix_keys, self._prefix_names = [], []
+        self._word_keys, self._word_names = [], []
+        self._canonical = {}
+        self._names = []
+
+    def load(self):
+        """Lê o arquivo e monta os índices (só na primeira chamada)."""
+        if self._loaded:
+            return self
+        with self._lock:
+            if not self._loaded:
+                self._build()
+                self._loaded = True
+        return self
+
+    def _build(self):
+        prefix_entries, word_entries = set(), set()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("#"):
+                    match = _VERSION_LINE.match(line)
+                    if match:
+                        self.version = match.group(1)
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                name = fields[0].strip()
+                if not name:
+                    continue
+                index = len(self._names)
+                self._names.append(name)
+                synonyms = [s.strip() for s in fields[1].split("|")] if len(fields) > 1 else []
+                for spelling in [name] + [s for s in synonyms if s]:
+                    key = normalize(spelling)
+                    self._canonical.setdefault(key, index)
+                    prefix_entries.add((key, index))
+                    # Cada palavra seguinte também é um ponto de partida ("acetil" acha "ÁCIDO ACETILSALICÍLICO")
+                    for match in re.finditer(r" (?=[^ +])", key):
+                        word_entries.add((key[match.end():], index))
+
+        for entries, keys, names in (
+            (prefix_entries, self._prefix_keys, self._prefix_names),
+            (word_entries, self._word_keys, self._word_names),
+        ):
+            for key, index in sorted(entries):
+                keys.append(key)
+                names.append(index)
+
+    def __len__(self):
+        return len(self.load()._names)
+
+    @staticmethod
+    def _matches(keys, names, query):
+        position = bisect_left(keys, query)
+        while position < len(keys) and keys[position].startswith(query):
+            yield names[position]
+            position += 1
+
+    def suggest(self, query, limit=10):
+        """Até `limit` nomes do catálogo que começam com `query` (ou com uma palavra que começa com ela)."""
+        self.load()
+        query = normalize(query)
+        if not query or limit <= 0:
+            return []
+        found = []
+        seen = set()
+        for keys, names in ((self._prefix_keys, self._prefix_names), (self._word_keys, self._word_names)):
+            # As chaves estão em ordem alfabética (sem acentos): a primeira ocorrência de cada nome basta
+            for index in self._matches(keys, names, query):
+                if index in seen:
+                    continue
+                seen.add(index)
+                found.append(self._names[index])
+                if len(found) == limit:
+                    return found
+        return found
+
+    def canonical(self, name):
+        """Nome do catálogo para `name` (grafia exata, sem diferença de acentos ou de caixa, ou sinônimo), ou None."""
+        index = self.load()._canonical.get(normalize(name))
+        return None if index is None else self._names[index]
+
+
+_default_catalog = None
+
+
+def default_catalog():
+    """O catálogo padrão, compartilhado pelo processo (carregado no primeiro uso)."""
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = DrugCatalog()
+    return _default_catalog
+
+
+def suggest(query, limit=10):
+    return default_catalog().suggest(query, limit)
+
+
+def canonical(name):
+    return default_catalog().canonical(name)
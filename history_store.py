@@ -0,0 +1,265 @@
+"""
+Histórico local das prescrições emitidas (SQLite).
+
+Cada prescrição gerada pela CLI (`imprimir`, `batch`, `repetir`) ou pela API
+(/prescribe, /prescribe/batch, /prescribe/merged e os jobs assíncronos) vira
+uma linha com o emitente, o paciente, as medicações, o template, o momento da
+emissão e dois hashes:
+
+    render_key   pdf_cache.cache_key(): tudo que determina o PDF
+    output_hash  SHA-256 dos bytes do PDF gerado (nulo no PDF combinado)
+
+As buscas usam índices por paciente (nome sem acentos e CPF só com dígitos),
+CRM do emitente, nome da medicação e data, sempre da mais recente para a mais
+antiga; nomes são buscados pelo prefixo:
+
+    search(patient="cleuza", drug="amitrip", since=date(2025, 1, 1))
+    latest(cpf="280.122.406-53")
+
+Configuração por variáveis de ambiente:
+    PRESCREVEAI_HISTORY_DB  arquivo SQLite (padrão: history.sqlite3 ao lado do programa)
+    PRESCREVEAI_HISTORY     0 para não gravar o histórico (padrão: 1)
+"""
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+from drug_catalog import normalize
+from medparser import json_default
+from pdf_cache import cache_key
+from render_context import RenderContext
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prescriptions (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    emitter_crm TEXT NOT NULL,
+    patient_key TEXT NOT NULL,
+    patient_cpf TEXT NOT NULL,
+    template TEXT NOT NULL,
+    medications TEXT NOT NULL,
+    context TEXT NOT NULL,
+    render_key TEXT NOT NULL,
+    output_hash TEXT,
+    output_path TEXT,
+    source TEXT NOT NULL,
+    repeated_from INTEGER
+);
+CREATE INDEX IF NOT EXISTS prescriptions_patient ON prescriptions (patient_key, created_at);
+CREATE INDEX IF NOT EXISTS prescriptions_cpf ON prescriptions (patient_cpf, created_at);
+CREATE INDEX IF NOT EXISTS prescriptions_crm ON prescriptions (emitter_crm, created_at);
+CREATE INDEX IF NOT EXISTS prescriptions_date ON prescriptions (created_at);
+CREATE TABLE IF NOT EXISTS prescription_drugs (
+    drug TEXT NOT NULL,
+    prescription_id INTEGER NOT NULL,
+    PRIMARY KEY (drug, prescription_id)
+) WITHOUT ROWID;
+"""
+
+_COLUMNS = (
+    "id, created_at, medications, context, render_key, output_hash, output_path, source, repeated_from"
+)
+
+# Maior que qualquer caractere: `chave >= p AND chave < p + _PREFIX_END` é uma busca por prefixo no índice
+_PREFIX_END = "\U0010ffff"
+
+
+class HistoryNotFound(Exception):
+    """Levantada quando a prescrição não existe no histórico."""
+
+
+def _digits(text):
+    return re.sub(r"\D", "", text or "")
+
+
+def output_hash(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def _timestamp(day):
+    """Início do dia `day` (date ou "AAAA-MM-DD"), no fuso local, como timestamp."""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return time.mktime(day.timetuple())
+
+
+def _row_to_entry(row):
+    prescription_id, created_at, medications, context, render_key, pdf_hash, output_path, source, repeated_from = row
+    context = json.loads(context)
+    return {
+        "id": prescription_id,
+        "created_at": datetime.fromtimestamp(created_at, timezone.utc).isoformat(),
+        "issue_date": context["issue_date"],
+        "template": context["template"],
+        "emitter": context["emitter"],
+        "patient": context["patient"],
+        "medicacoes": json.loads(medications),
+        "render_key": render_key,
+        "output_hash": pdf_hash,
+        "output_path": output_path,
+        "source": source,
+        "repeated_from": repeated_from,
+    }
+
+
+def entry_context(entry, issue_date=None, template=None):
+    """
+    O RenderContext de uma prescrição do histórico, para emiti-la de novo:
+    por padrão com a data de hoje e o mesmo template.
+    """
+    context = RenderContext.from_dict({
+        "emitter": entry["emitter"],
+        "patient": entry["patient"],
+        "template": entry["template"],
+        "issue_date": entry["issue_date"],
+    })
+    return dataclasses.replace(
+        context,
+        issue_date=issue_date or date.today(),
+        template=template or context.template,
+    )
+
+
+class HistoryStore:
+    def __init__(self, path=None, enabled=None):
+        self.path = path or os.environ.get("PRESCREVEAI_HISTORY_DB") or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "history.sqlite3")
+        if enabled is None:
+            enabled = os.environ.get("PRESCREVEAI_HISTORY", "1") != "0"
+        self.enabled = enabled
+        self._initialized = False # O banco só é criado no primeiro uso
+
+    @contextmanager
+    def _connect(self):
+        # Uma conexão por operação, como na JobQueue: as chamadas vêm de threads e processos diferentes
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            if not self._initialized:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(_SCHEMA)
+                self._initialized = True
+            # No WAL, NORMAL não faz fsync a cada commit (só nos checkpoints)
+            db.execute("PRAGMA synchronous=NORMAL")
+            yield db
+        finally:
+            db.close()
+
+    def record(self, medications, context, pdf_bytes=None, output_path=None, source="cli", repeated_from=None):
+        """Grava uma prescrição emitida e retorna seu id (None com o histórico desativado)."""
+        if not self.enabled:
+            return None
+        ids = self.record_many([{
+            "medications": medications,
+            "context": context,
+            "output_hash": output_hash(pdf_bytes) if pdf_bytes is not None else None,
+            "output_path": output_path,
+            "source": source,
+            "repeated_from": repeated_from,
+        }])
+        return ids[0] if ids else None
+
+    def record_many(self, entries):
+        """
+        Grava várias prescrições em uma única transação. Cada entrada é um dict
+        com medications e context e, opcionalmente, render_key (calculada se
+        ausente), output_hash, output_path, source e repeated_from.
+        """
+        if not self.enabled or not entries:
+            return []
+        now = time.time()
+        ids = []
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for entry in entries:
+                    context = entry["context"]
+                    medications = entry["medications"]
+                    cursor = db.execute(
+                        "INSERT INTO prescriptions (created_at, emitter_crm, patient_key, patient_cpf, template,"
+                        " medications, context, render_key, output_hash, output_path, source, repeated_from)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            now,
+                            normalize(context.emitter.get("crm", "")),
+                            normalize(context.patient.get("nome", "")),
+                            _digits(context.patient.get("cpf")),
+                            context.template,
+                            json.dumps(medications, ensure_ascii=False, default=json_default),
+                            json.dumps(context.to_dict(), ensure_ascii=False),
+                            entry.get("render_key") or cache_key(medications, context),
+                            entry.get("output_hash"),
+                            entry.get("output_path"),
+                            entry.get("source", "cli"),
+                            entry.get("repeated_from"),
+                        ),
+                    )
+                    prescription_id = cursor.lastrowid
+                    drugs = {normalize(medication["nome"]) for medication in medications}
+                    db.executemany(
+                        "INSERT INTO prescription_drugs (drug, prescription_id) VALUES (?, ?)",
+                        [(drug, prescription_id) for drug in drugs if drug],
+                    )
+                    ids.append(prescription_id)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return ids
+
+    def get(self, prescription_id):
+        """Uma prescrição do histórico. Levanta HistoryNotFound."""
+        with self._connect() as db:
+            row = db.execute(f"SELECT {_COLUMNS} FROM prescriptions WHERE id = ?", (prescription_id,)).fetchone()
+        if row is None:
+            raise HistoryNotFound(prescription_id)
+        return _row_to_entry(row)
+
+    def search(self, patient=None, cpf=None, crm=None, drug=None, since=None, until=None, limit=50):
+        """
+        Prescrições que atendem a todos os filtros informados, da mais recente
+        para a mais antiga: `patient` e `drug` são prefixos do nome (sem
+        diferença de acentos ou de caixa), `cpf` e `crm` são exatos e
+        `since`/`until` são datas (inclusive).
+        """
+        conditions, params = [], []
+        if patient:
+            key = normalize(patient)
+            conditions.append("patient_key >= ? AND patient_key < ?")
+            params += [key, key + _PREFIX_END]
+        if cpf:
+            conditions.append("patient_cpf = ?")
+            params.append(_digits(cpf))
+        if crm:
+            conditions.append("emitter_crm = ?")
+            params.append(normalize(crm))
+        if drug:
+            key = normalize(drug)
+            conditions.append(
+                "id IN (SELECT prescription_id FROM prescription_drugs WHERE drug >= ? AND drug < ?)"
+            )
+            params += [key, key + _PREFIX_END]
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(_timestamp(since))
+        if until:
+            until = date.fromisoformat(until) if isinstance(until, str) else until
+            conditions.append("created_at < ?")
+            params.append(_timestamp(until + timedelta(days=1)))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as db:
+            rows = db.execute(
+                f"SELECT {_COLUMNS} FROM prescriptions{where} ORDER BY created_at DESC, id DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [_row_to_entry(row) for row in rows]
+
+    def latest(self, **filters):
+        """A prescrição mais recente que atende aos filtros de search(), ou None."""
+        found = self.search(limit=1, **filters)
+        return found[0] if found else None
@@ -0,0 +1,298 @@
+"""
+Fila persistente de jobs de renderização (SQLite).
+
+O POST /prescribe?async=1 valida e faz o parsing na hora, grava o job aqui e
+responde com o id; o JobRunner de cada worker da API consome a fila em
+segundo plano, renderiza no render_engine e guarda o PDF no próprio banco.
+
+    queued -> running -> done | error
+
+Um job em "running" tem um prazo (lease). Se o processo que o pegou morrer ou
+o servidor for reiniciado, o job volta a ser elegível quando o prazo vence;
+depois de MAX_ATTEMPTS tentativas, ele é marcado como erro. Jobs (e seus PDFs)
+são apagados quando expiram.
+
+Configuração por variáveis de ambiente:
+    PRESCREVEAI_JOBS_DB   arquivo SQLite (padrão: jobs.sqlite3 ao lado do programa)
+    PRESCREVEAI_JOBS_TTL  segundos até um job expirar (padrão: 86400)
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from medparser import json_default
+from render_context import RenderContext
+
+MAX_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    medications TEXT NOT NULL,
+    context TEXT NOT NULL,
+    pdf BLOB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_until REAL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_expiry ON jobs (expires_at);
+"""
+
+
+class JobNotFound(Exception):
+    """Levantada quando o job não existe ou já expirou."""
+
+
+def _isoformat(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class JobQueue:
+    def __init__(self, path=None, ttl=None):
+        self.path = path or os.environ.get("PRESCREVEAI_JOBS_DB") or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "jobs.sqlite3")
+        self.ttl = ttl or float(os.environ.get("PRESCREVEAI_JOBS_TTL", 86400))
+        self._initialized = False # O banco só é criado no primeiro uso
+
+    @contextmanager
+    def _connect(self):
+        # Uma conexão por operação: as chamadas vêm de threads diferentes (asyncio.to_thread)
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            if not self._initialized:
+                # WAL: leituras (GET /jobs) não esperam a escrita de PDFs de outros workers
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(_SCHEMA)
+                self._initialized = True
+            yield db
+        finally:
+            db.close()
+
+    def enqueue(self, medications, context):
+        """Grava um job novo e retorna seu id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, status, medications, context, created_at, expires_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, json.dumps(medications, ensure_ascii=False, default=json_default), json.dumps(context.to_dict(), ensure_ascii=False), now, now + self.ttl),
+            )
+        return job_id
+
+    def claim(self, lease_seconds):
+        """
+        Pega o job pendente mais antigo (ou um "running" com o prazo vencido) e
+        o marca como "running". Retorna (id, medicações, RenderContext) ou None.
+        """
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE") # Trava de escrita: dois workers nunca pegam o mesmo job
+            try:
+                while True:
+                    row = db.execute(
+                        "SELECT id, medications, context, attempts FROM jobs"
+                        " WHERE (status = 'queued' OR (status = 'running' AND lease_until < ?)) AND expires_at > ?"
+                        " ORDER BY created_at LIMIT 1",
+                        (now, now),
+                    ).fetchone()
+                    if row is None:
+                        db.execute("COMMIT")
+                        return None
+                    job_id, medications, context, attempts = row
+                    if attempts < MAX_ATTEMPTS:
+                        break
+                    # Esgotou as tentativas: vira erro e o próximo da fila é pego na mesma transação
+                    db.execute(
+                        "UPDATE jobs SET status = 'error', error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                        (f"Renderização interrompida {attempts} vezes", now, job_id),
+                    )
+                db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_until = ? WHERE id = ?",
+                    (now, now + lease_seconds, job_id),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return job_id, json.loads(medications), RenderContext.from_dict(json.loads(context))
+
+    def complete(self, job_id, pdf_bytes):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'done', pdf = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                (pdf_bytes, time.time(), job_id),
+            )
+
+    def fail(self, job_id, error):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'error', error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def release(self, job_id):
+        """Devolve um job em andamento à fila (fila do render_engine cheia ou servidor parando)."""
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'queued', attempts = attempts - 1, lease_until = NULL WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def get(self, job_id):
+        """Estado público do job (sem o PDF). Levanta JobNotFound."""
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT status, medications, context, error, created_at, finished_at, expires_at FROM jobs"
+                " WHERE id = ? AND expires_at > ?",
+                (job_id, time.time()),
+            ).fetchone()
+        if row is None:
+            raise JobNotFound(job_id)
+        status, medications, context, error, created_at, finished_at, expires_at = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "template": json.loads(context)["template"],
+            "medicacoes": json.loads(medications),
+            "error": error,
+            "created_at": _isoformat(created_at),
+            "finished_at": _isoformat(finished_at),
+            "expires_at": _isoformat(expires_at),
+        }
+
+    def get_pdf(self, job_id):
+        """(status, template, erro, bytes do PDF ou None). Levanta JobNotFound."""
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT status, context, error, pdf FROM jobs WHERE id = ? AND expires_at > ?", (job_id, time.time())
+            ).fetchone()
+        if row is None:
+            raise JobNotFound(job_id)
+        status, context, error, pdf_bytes = row
+        return status, json.loads(context)["template"], error, pdf_bytes
+
+    def pending(self):
+        """Jobs aguardando ou em renderização."""
+        if not self._initialized and not os.path.exists(self.path):
+            return 0 # Não cria o banco só para contar
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    def purge_expired(self):
+        """Apaga os jobs expirados e retorna quantos foram apagados."""
+        with self._connect() as db:
+            return db.execute("DELETE FROM jobs WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+class JobRunner:
+    """
+    Consome a JobQueue em segundo plano, dentro do event loop da API, com até
+    `concurrency` jobs renderizando ao mesmo tempo. `render` é uma corrotina
+    render(medications, context) -> bytes (na API, render_cached).
+    """
+
+    # Intervalo de consulta ao banco quando não há aviso de job novo (jobs de
+    # outros workers ou que sobraram de antes de um reinício)
+    POLL_INTERVAL = 1.0
+    PURGE_INTERVAL = 60.0
+    # Espera antes de tentar de novo depois de um erro do banco
+    ERROR_BACKOFF = 5.0
+
+    def __init__(self, queue, render, concurrency=1, lease_seconds=120, busy_errors=()):
+        self.queue = queue
+        self.render = render
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        # Exceções de render que significam "tente de novo mais tarde" (ex.: RenderQueueFull)
+        self.busy_errors = tuple(busy_errors)
+        self._wakeup = None
+        self._tasks = []
+        self._running_jobs = set()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._consume()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.ensure_future(self._purge_periodically()))
+
+    async def stop(self):
+        """Para de consumir e devolve à fila os jobs que estavam renderizando."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job_id in list(self._running_jobs):
+            await asyncio.to_thread(self.queue.release, job_id)
+        self._running_jobs.clear()
+
+    def notify(self):
+        """Avisa os consumidores deste processo que há um job novo."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _consume(self):
+        # Uma falha do banco (ex.: "database is locked" depois do timeout) não
+        # pode encerrar o consumidor: registra, espera e tenta de novo
+        while True:
+            try:
+                await self._consume_one()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Falha ao consumir a fila de jobs; nova tentativa em %g s", self.ERROR_BACKOFF)
+                await asyncio.sleep(self.ERROR_BACKOFF)
+
+    async def _consume_one(self):
+        job = await asyncio.to_thread(self.queue.claim, self.lease_seconds)
+        if job is None:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        job_id, medications, context = job
+        self._running_jobs.add(job_id)
+        busy = False
+        try:
+            pdf_bytes = await self.render(medications, context)
+        except self.busy_errors:
+            busy = True
+            outcome = (self.queue.release, job_id)
+        except asyncio.CancelledError:
+            raise # stop() devolve o job à fila
+        except Exception as e:
+            outcome = (self.queue.fail, job_id, str(e) or type(e).__name__)
+        else:
+            outcome = (self.queue.complete, job_id, pdf_bytes)
+        try:
+            await asyncio.to_thread(*outcome)
+        finally:
+            # Se a gravação falhar, o job continua em "running" e volta à fila quando o prazo vencer
+            self._running_jobs.discard(job_id)
+        if busy:
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def _purge_periodically(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.queue.purge_expired)
+            except Exception:
+                logger.exception("Falha ao apagar os jobs expirados")
+            await asyncio.sleep(self.PURGE_INTERVAL)
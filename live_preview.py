@@ -0,0 +1,103 @@
+"""
+Estado de uma sessão de pré-visualização ao vivo (WebSocket /preview).
+
+A cada mensagem, o editor manda a string !MED inteira. A sessão divide a
+string em itens (os trechos entre `;`), reaproveita o resultado dos itens cujo
+texto já foi visto (cache por texto do item) e só chama medparser.parse_item
+para os que mudaram. A resposta é só a diferença para o estado anterior:
+
+    {"type": "diff", "version": 3, "reparsed": 1,
+     "changes": [{"start": 1, "delete": 1, "insert": [{"medicacao": {...}}]}],
+     "error": null}
+
+Cada item do estado é {"medicacao": {...}} ou {"erro": "..."}; itens em branco
+(";;") não entram. Para reproduzir o estado, o cliente aplica cada mudança em
+ordem: remove `delete` itens a partir de `start` e insere `insert` no lugar.
+`error` é o erro da string inteira (sem o prefixo !MED ou sem nenhum item),
+e `version` cresce a cada mensagem.
+"""
+from collections import OrderedDict
+
+import medparser
+
+# Itens guardados no cache de cada sessão (texto do item -> resultado)
+ITEM_CACHE_SIZE = 512
+
+
+class PreviewSession:
+    def __init__(self, parser=None, cache_size=ITEM_CACHE_SIZE):
+        self.parser = parser or medparser.default_parser
+        self.cache_size = cache_size
+        self.version = 0
+        self.items = []
+        self.error = None
+        self._cache = OrderedDict()
+
+    @property
+    def medications(self):
+        """As medicações válidas do estado atual, na ordem da string."""
+        return [item["medicacao"] for item in self.items if "medicacao" in item]
+
+    @property
+    def has_item_errors(self):
+        return any("erro" in item for item in self.items)
+
+    def _parse_item(self, text):
+        cache = self._cache
+        if text in cache:
+            cache.move_to_end(text)
+            return cache[text], False
+        parsed = self.parser.parse_item(text)
+        if parsed is None:
+            entry = None
+        else:
+            medication, message = parsed
+            entry = {"medicacao": medication.to_dict()} if medication is not None else {"erro": message}
+        cache[text] = entry
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return entry, True
+
+    def update(self, text):
+        """Processa uma nova versão da string e retorna a mensagem de diferença."""
+        reparsed = 0
+        items = []
+        pieces = medparser.split_items(text)
+        if pieces is None:
+            error = "Input must start with '!MED '"
+        else:
+            for piece in pieces:
+                entry, parsed_now = self._parse_item(piece)
+                reparsed += parsed_now
+                if entry is not None:
+                    items.append(entry)
+            error = None if items else "No valid medications found in input."
+
+        changes = _diff(self.items, items)
+        self.items = items
+        self.error = error
+        self.version += 1
+        return {"type": "diff", "version": self.version, "reparsed": reparsed, "changes": changes, "error": error}
+
+    def snapshot(self):
+        """O estado completo, para um cliente que perdeu a sincronia."""
+        return {"type": "snapshot", "version": self.version, "items": self.items, "error": self.error}
+
+
+def _diff(old, new):
+    """
+    Diferença entre duas listas de itens como um único trecho trocado: o que
+    sobra depois de descontar o prefixo e o sufixo em comum (edições em um
+    editor mudam um trecho contíguo da string).
+    """
+    limit = min(len(old), len(new))
+    start = 0
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end_old, end_new = len(old), len(new)
+    while end_old > start and end_new > start and old[end_old - 1] == new[end_new - 1]:
+        end_old -= 1
+        end_new -= 1
+    if end_old == start and end_new == start:
+        return []
+    return [{"start": start, "delete": end_old - start, "insert": new[start:end_new]}]
@@ -0,0 +1,289 @@
+"""
+Parser das strings de medicação.
+
+Formato: !MED NOME DOSAGEM [COMENTARIO] POSOLOGIA; NOME DOSAGEM POSOLOGIA; ...
+
+A gramática de um item (nome, dosagem com unidade, comentário opcional entre
+colchetes e posologia) é compilada uma vez em uma única expressão regular, que
+percorre a string inteira em uma só passada: cada casamento consome um item e o
+`;` que o precede. Itens que não seguem a gramática caem em um ramo alternativo
+da mesma expressão, para que todos os erros sejam reportados de uma vez.
+
+As unidades de dosagem aceitas ficam em uma tabela extensível (DEFAULT_UNITS,
+MedicationParser(units=...) ou register_unit()).
+
+Opcionalmente, os nomes reconhecidos no catálogo de medicamentos
+(drug_catalog) são trocados pela grafia do catálogo ("acido folico" ->
+"ÁCIDO FÓLICO", "metamizol" -> "DIPIRONA"): MedicationParser(catalog=...),
+enable_drug_normalization() ou PRESCREVEAI_NORMALIZE_DRUGS=1. Nomes fora do
+catálogo continuam só em maiúsculas.
+
+As medicações são registros Medication (dataclass com __slots__: nome,
+dosagem, comentario, posologia), consumidos diretamente pelos geradores de PDF
+e pela resposta JSON da API. to_dict() / Medication.to_dict() dão o formato
+histórico em dicts; medication["nome"] também funciona.
+
+Uso:
+    result = medparser.parse("!MED DIPIRONA 500MG 1 COMPRIMIDO A CADA 6 HORAS")
+    result.medications  # lista de Medication
+    result.errors       # lista de ItemError, um por item inválido
+    result.to_dict()    # formato de prescreveai.parse_medication_string
+
+Verificação do corpus de regressão:
+    python medparser.py --check [corpus/medparser_corpus.jsonl]
+"""
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+PREFIX = "!MED "
+
+# Unidades de dosagem aceitas por padrão (maiúsculas ou minúsculas na entrada)
+DEFAULT_UNITS = ("MG", "ML", "G", "MCG", "UI", "MG/ML", "GOTAS", "COMPRIMIDOS", "CÁPSULAS", "%")
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "medparser_corpus.jsonl")
+
+
+@dataclass(slots=True)
+class Medication:
+    """Uma medicação reconhecida pelo parser. Sem dict por instância: cabe em 64 bytes."""
+    nome: str
+    dosagem: str
+    comentario: Optional[str]
+    posologia: str
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["nome"], data["dosagem"], data.get("comentario"), data["posologia"])
+
+    def to_dict(self):
+        return {"nome": self.nome, "dosagem": self.dosagem, "comentario": self.comentario, "posologia": self.posologia}
+
+    def __getitem__(self, key):
+        # Compatibilidade com o código que lê as medicações como dicts
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __reduce__(self):
+        # Os argumentos do construtor: pickle menor e mais rápido que o estado padrão dos slots,
+        # para a ida aos processos do render_engine e do `batch`
+        return Medication, (self.nome, self.dosagem, self.comentario, self.posologia)
+
+
+def json_default(value):
+    """`default` para json.dumps: serializa Medication como o dict histórico."""
+    if isinstance(value, Medication):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def medications_json(medications):
+    """As medicações (Medication ou dicts) como um array JSON compacto, sem validação."""
+    return json.dumps(medications, ensure_ascii=False, separators=(",", ":"), default=json_default)
+
+
+@dataclass(frozen=True)
+class ItemError:
+    """Erro de um item da string. `index` é a posição do item (None para erros da string inteira)."""
+    index: Optional[int]
+    item: Optional[str]
+    message: str
+
+    def to_dict(self):
+        return {"index": self.index, "item": self.item, "message": self.message}
+
+
+@dataclass
+class ParseResult:
+    medications: List[Medication] = field(default_factory=list)
+    errors: List[ItemError] = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def to_dict(self):
+        """Converte para o formato histórico: {"medicacoes": [...]} ou {"error": primeira mensagem}."""
+        if self.errors:
+            return {"error": self.errors[0].message}
+        return {"medicacoes": [medication.to_dict() for medication in self.medications]}
+
+
+def split_items(input_string):
+    """Os itens de uma string !MED, como parse() os vê (None se falta o prefixo)."""
+    if not input_string.startswith(PREFIX):
+        return None
+    return input_string[len(PREFIX):].strip().split(";")
+
+
+def _compile_grammar(units):
+    # Unidades mais longas primeiro, para que MG/ML não seja lido como MG
+    unit_alternatives = "|".join(re.escape(unit) for unit in sorted(set(units), key=len, reverse=True))
+    return re.compile(
+        r"(?:\A|;)\s*"
+        r"(?:"
+        r"(?P<name>[^;\s][^;\n]*?)\s+"
+        rf"(?P<dosage>\d+\.?\d*(?:{unit_alternatives}))\s*"
+        r"(?:\[(?P<comment>[^;\n]*?)\])?\s*"
+        r"(?P<posology>[^;\n]*?)\s*(?=;|\Z)"
+        r"|"
+        r"(?P<invalid>[^;]*)"
+        r")",
+        re.IGNORECASE,
+    )
+
+
+class MedicationParser:
+    def __init__(self, units=DEFAULT_UNITS, catalog=None):
+        self.units = tuple(units)
+        self._grammar = _compile_grammar(self.units)
+        # drug_catalog.DrugCatalog usado para normalizar os nomes (None: só maiúsculas)
+        self.catalog = catalog
+
+    def add_units(self, *units):
+        """Acrescenta unidades à tabela e recompila a gramática."""
+        self.units = self.units + tuple(unit.upper() for unit in units if unit.upper() not in self.units)
+        self._grammar = _compile_grammar(self.units)
+
+    def parse(self, input_string):
+        """Faz o parsing de uma string !MED e devolve um ParseResult com todas as medicações e erros."""
+        result = ParseResult()
+        if not input_string.startswith(PREFIX):
+            result.errors.append(ItemError(None, None, "Input must start with '!MED '"))
+            return result
+
+        body = input_string[len(PREFIX):].strip()
+        index = 0
+        for match in self._grammar.finditer(body):
+            parsed = self._parse_match(match)
+            if parsed is None:
+                continue
+            medication, item, message = parsed
+            if medication is not None:
+                result.medications.append(medication)
+            else:
+                result.errors.append(ItemError(index, item, message))
+            index += 1
+
+        if not result.medications and not result.errors:
+            result.errors.append(ItemError(None, None, "No valid medications found in input."))
+        return result
+
+    def parse_item(self, item):
+        """
+        Faz o parsing de um único item: um pedaço de split_items(), sem
+        alterações (espaços e quebras de linha nas pontas são ignorados, como
+        em parse()). Retorna (medicação, None), (None, mensagem de erro) ou None
+        para um item em branco, que parse() ignora.
+        """
+        parsed = self._parse_match(self._grammar.match(item))
+        if parsed is None:
+            return None
+        medication, _, message = parsed
+        return medication, message
+
+    def _parse_match(self, match):
+        # (medicação, item, None), (None, item, mensagem de erro) ou None para um item em branco
+        name, dosage, comment, posology, invalid = match.group("name", "dosage", "comment", "posology", "invalid")
+        if invalid is not None:
+            invalid = invalid.rstrip()
+            if not invalid:
+                return None
+            return None, invalid, f"Could not parse medication item: {invalid}"
+
+        posology = posology.rstrip()
+        if not posology:
+            item = match.group(0).lstrip(";").strip()
+            return None, item, f"Posology cannot be empty in: {item}"
+        catalog = self.catalog
+        return Medication(
+            (catalog is not None and catalog.canonical(name)) or name.upper(),
+            dosage.upper(),
+            comment.strip().upper() if comment is not None else None,
+            posology.upper(),
+        ), None, None
+
+    def parse_many(self, input_strings):
+        """Gerador: um ParseResult para cada string de `input_strings`, sob demanda."""
+        parse = self.parse
+        for input_string in input_strings:
+            yield parse(input_string)
+
+
+default_parser = MedicationParser()
+
+
+def parse(input_string):
+    return default_parser.parse(input_string)
+
+
+def parse_many(input_strings):
+    return default_parser.parse_many(input_strings)
+
+
+def parse_item(item):
+    return default_parser.parse_item(item)
+
+
+def register_unit(*units):
+    """Acrescenta unidades à tabela do parser padrão."""
+    default_parser.add_units(*units)
+
+
+def enable_drug_normalization(catalog=None):
+    """Faz o parser padrão normalizar os nomes pelo catálogo (padrão: drug_catalog.default_catalog())."""
+    if catalog is None:
+        import drug_catalog
+        catalog = drug_catalog.default_catalog()
+    default_parser.catalog = catalog
+
+
+if os.environ.get("PRESCREVEAI_NORMALIZE_DRUGS") == "1":
+    enable_drug_normalization()
+
+
+def format_medication_text(medication):
+    """Formats a single medication (Medication or dictionary) into a human-readable string for PDF."""
+    if isinstance(medication, dict):
+        medication = Medication.from_dict(medication)
+    name = medication.nome.title() # Title case for better readability in PDF
+    dosage = medication.dosagem.upper()
+    comment = medication.comentario
+    posology = medication.posologia.capitalize()
+
+    if comment:
+        return f"{name} {dosage} [{comment}] {posology}"
+    else:
+        return f"{name} {dosage} {posology}"
+
+
+def check_corpus(path=DEFAULT_CORPUS):
+    """
+    Compara o parser com as saídas esperadas do corpus de regressão (JSONL com
+    "input" e "expected" no formato de to_dict()). Retorna a lista de divergências.
+    """
+    failures = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            got = parse(case["input"]).to_dict()
+            if got != case["expected"]:
+                failures.append({"line": line_number, "input": case["input"], "expected": case["expected"], "got": got})
+    return failures
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--check":
+        corpus_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CORPUS
+        failures = check_corpus(corpus_path)
+        for failure in failures:
+            print(json.dumps(failure, ensure_ascii=False))
+        print(f"{'OK' if not failures else 'FALHOU'}: {len(failures)} divergência(s) em {corpus_path}")
+        sys.exit(1 if failures else 0)
+    print(__doc__)
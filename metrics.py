@@ -0,0 +1,233 @@
+"""
+Métricas do PrescreveAI no formato texto do Prometheus.
+
+Implementação mínima (histogramas, contadores e gauges com rótulos), sem
+dependências: a API expõe o registro padrão em GET /metrics e o modo em lote
+da CLI pode gravá-lo em arquivo (`prescreveai batch --metrics`), no formato
+aceito pelo textfile collector do node_exporter.
+
+Os estágios de uma prescrição são medidos com um StageTimer e observados de uma
+vez em STAGE_SECONDS, rotulados pelo estágio, template e faixa de número de
+medicações:
+    validation  validação do corpo pelo pydantic (API)
+    parse       parse_medication_string
+    queue       espera no render_engine (fila + transferência entre processos)
+    draw        desenho no canvas do reportlab
+    save        c.save(): serialização do PDF
+    serialize   montagem da resposta (base64 + JSON; API)
+    write       gravação do arquivo PDF (CLI)
+    history     gravação no histórico de prescrições (history_store)
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from render_context import TEMPLATE_FILENAMES
+
+# Limites dos buckets de latência, em segundos
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Faixas do rótulo "medications": até 1, até 5, até 10, até 50, mais de 50
+MEDICATION_BUCKETS = (1, 5, 10, 50)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def medication_bucket(count):
+    """Rótulo da faixa de número de medicações ("0", "1", "2-5", "6-10", "11-50", "51+")."""
+    if count <= 0:
+        return "0"
+    lower = 1
+    for upper in MEDICATION_BUCKETS:
+        if count <= upper:
+            return str(upper) if lower == upper else f"{lower}-{upper}"
+        lower = upper + 1
+    return f"{lower}+"
+
+
+def template_label(template):
+    """Rótulo do template; nomes desconhecidos viram "unknown" para não multiplicar as séries."""
+    return template if template in TEMPLATE_FILENAMES else "unknown"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Sem rótulos, `function` fornece o valor no momento da coleta
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, label_values):
+        if len(label_values) != len(self.labelnames):
+            raise ValueError(f"{self.name} espera os rótulos {self.labelnames}, recebeu {label_values}")
+        return label_values
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        if self.function is not None:
+            return lines + self._sample_lines((), self.function())
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda item: tuple(map(str, item[0])))
+        for label_values, value in items:
+            lines.extend(self._sample_lines(label_values, value))
+        return lines
+
+    def _sample_lines(self, label_values, value):
+        return [f"{self.name}{_format_labels(self.labelnames, label_values)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *label_values, amount=1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *label_values, amount=1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [contagem por bucket (não cumulativa)..., soma]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0]
+            state[bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def _sample_lines(self, label_values, state):
+        lines = []
+        cumulative = 0
+        for upper, count in zip(self.buckets, state):
+            cumulative += count
+            le = 'le="' + _format_value(upper) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, label_values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, label_values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica já registrada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def expose(self):
+        """Todas as métricas no formato texto do Prometheus."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Grava o registro em `path` (substituição atômica, como pede o textfile collector)."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.expose())
+        os.replace(tmp_path, path)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "prescreveai_stage_seconds",
+    "Tempo gasto em cada estágio de uma prescrição.",
+    ("stage", "template", "medications"),
+))
+PRESCRIPTIONS = REGISTRY.register(Counter(
+    "prescreveai_prescriptions_total",
+    "Prescrições processadas, por template e resultado (ok, error).",
+    ("template", "result"),
+))
+
+
+class StageTimer:
+    """Acumula a duração de cada estágio de uma prescrição (segundos) em `timings`."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def update(self, timings):
+        for name, seconds in timings.items():
+            self.add(name, seconds)
+
+
+def observe_stages(timings, template, medication_count, histogram=STAGE_SECONDS):
+    """Registra os tempos de um StageTimer (ou dict estágio -> segundos) no histograma de estágios."""
+    if isinstance(timings, StageTimer):
+        timings = timings.timings
+    bucket = medication_bucket(medication_count)
+    for stage, seconds in timings.items():
+        histogram.observe(seconds, stage, template, bucket)
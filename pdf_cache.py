@@ -0,0 +1,216 @@
+"""
+Cache de PDFs endereçado por conteúdo.
+
+A chave é o hash SHA-256 de tudo que determina o PDF: a lista de medicações já
+normalizada pelo parser, os dados do emitente e do paciente, o template e a
+data de emissão. Uma reimpressão idêntica devolve os bytes do cache sem passar
+pelo reportlab.
+
+Há dois níveis:
+    - memória: LRU limitado por número de entradas;
+    - disco (opcional): um arquivo por chave, limitado em bytes, com despejo
+      dos arquivos menos usados recentemente (mtime).
+
+Configuração por variáveis de ambiente:
+    PRESCREVEAI_CACHE_ENTRIES  entradas no nível de memória (padrão: 256; 0 desativa)
+    PRESCREVEAI_CACHE_DIR      diretório do nível de disco (padrão: desativado)
+    PRESCREVEAI_CACHE_DISK_MB  tamanho máximo do nível de disco em MB (padrão: 256)
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from medparser import json_default
+
+
+# Entra na chave: incremente quando a aparência dos PDFs mudar, para que PDFs
+# antigos guardados em disco (PRESCREVEAI_CACHE_DIR) não sejam mais servidos
+LAYOUT_VERSION = 2
+
+
+def cache_key(medications, context):
+    """Calcula a chave do PDF de `medications` renderizado com `context` (render_context.RenderContext)."""
+    payload = {
+        "layout": LAYOUT_VERSION,
+        "medicacoes": medications,
+        "emitente": context.emitter,
+        "paciente": context.patient,
+        "template": context.template,
+        "data": context.issue_date.isoformat(),
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=json_default)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    def __init__(self, max_entries=None, disk_dir=None, disk_max_bytes=None):
+        if max_entries is None:
+            max_entries = int(os.environ.get("PRESCREVEAI_CACHE_ENTRIES", 256))
+        if disk_dir is None:
+            disk_dir = os.environ.get("PRESCREVEAI_CACHE_DIR") or None
+        if disk_max_bytes is None:
+            disk_max_bytes = int(float(os.environ.get("PRESCREVEAI_CACHE_DISK_MB", 256)) * 1024 * 1024)
+
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._disk_bytes = None # Calculado sob demanda na primeira escrita
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    # --- Nível de memória ---
+
+    def get_memory(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return data
+
+    def put_memory(self, key, data):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    # --- Nível de disco ---
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.pdf")
+
+    def get_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path) # Marca como usado recentemente para o despejo LRU
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self.put_memory(key, data)
+        return data
+
+    def put_disk(self, key, data):
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        try:
+            # A chave determina o conteúdo: um arquivo que já existe tem os mesmos bytes
+            os.utime(path)
+            return
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escrita atômica: outros processos nunca leem um arquivo pela metade
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data)
+            disk_bytes = self._disk_bytes
+        if disk_bytes is None:
+            # Primeira escrita: a varredura do diretório fica fora do lock
+            disk_bytes = sum(size for _, size, _ in self._disk_entries())
+            with self._lock:
+                self._disk_bytes = disk_bytes
+        if disk_bytes > self.disk_max_bytes:
+            self._evict_disk()
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if not name.endswith(".pdf"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _evict_disk(self):
+        # Um despejo por vez; as outras threads seguem sem esperar a varredura
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            # Recalcula a partir do disco: outros processos podem compartilhar o diretório
+            entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            target = self.disk_max_bytes * 0.9 # Folga para não despejar a cada escrita
+            evicted = 0
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    evicted += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+            with self._lock:
+                self._disk_bytes = total
+                self.evictions += evicted
+        finally:
+            self._evict_lock.release()
+
+    # --- Interface combinada ---
+
+    def record_miss(self):
+        """Conta um miss para quem consulta os níveis separadamente (get_memory/get_disk)."""
+        with self._lock:
+            self.misses += 1
+
+    def get(self, key):
+        """Procura na memória e depois no disco. Retorna None (e conta um miss) se não encontrar."""
+        data = self.get_memory(key)
+        if data is None:
+            data = self.get_disk(key)
+        if data is None:
+            self.record_miss()
+        return data
+
+    def put(self, key, data):
+        self.put_memory(key, data)
+        self.put_disk(key, data)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_max_entries": self.max_entries,
+                "disk_enabled": bool(self.disk_dir),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,125 @@
+"""
+Diagramação do texto das prescrições, antes de desenhar.
+
+Os geradores de pdf_render não decidem mais, linha a linha, onde quebrar a
+página: primeiro montam blocos de texto (uma medicação = um bloco), quebram
+cada linha na largura disponível (wrap_text) e paginam o documento inteiro
+(paginate). O resultado é um Layout com a posição de cada linha em cada página
+e o ponto onde o conteúdo termina, que o desenho no canvas só executa.
+
+As larguras vêm de text_width, memoizada por (palavra, fonte, tamanho): cada
+palavra é medida uma única vez por processo, e a largura de uma linha é a soma
+das larguras das palavras e dos espaços (as fontes padrão do PDF não têm
+kerning).
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+
+@lru_cache(maxsize=16384)
+def text_width(text, font, size):
+    """Largura de `text` em pontos (memoizada)."""
+    return stringWidth(text, font, size)
+
+
+def _split_word(word, font, size, max_width):
+    """Quebra uma palavra mais larga que a linha em pedaços que caibam nela."""
+    pieces = []
+    start = 0
+    for end in range(1, len(word) + 1):
+        if end - start > 1 and text_width(word[start:end], font, size) > max_width:
+            pieces.append(word[start:end - 1])
+            start = end - 1
+    pieces.append(word[start:])
+    return pieces
+
+
+def wrap_text(text, font, size, max_width):
+    """Quebra `text` em linhas de no máximo `max_width` pontos, nos espaços entre palavras."""
+    space = text_width(" ", font, size)
+    lines = []
+    current = []
+    width = 0.0
+    for word in text.split():
+        word_width = text_width(word, font, size)
+        if word_width > max_width:
+            if current:
+                lines.append(" ".join(current))
+            *full, word = _split_word(word, font, size, max_width)
+            lines.extend(full)
+            current, width = [word], text_width(word, font, size)
+        elif current and width + space + word_width > max_width:
+            lines.append(" ".join(current))
+            current, width = [word], word_width
+        else:
+            width += word_width + (space if current else 0.0)
+            current.append(word)
+    if current or not lines:
+        lines.append(" ".join(current))
+    return lines
+
+
+@dataclass(frozen=True)
+class Layout:
+    """
+    Plano de desenho: `pages` tem, para cada página, as linhas (x, y, texto);
+    `end_y` é a altura logo abaixo da última linha, na última página, onde
+    começa o que vem depois do texto (ex.: a assinatura).
+    """
+    pages: tuple
+    end_y: float
+
+
+def paginate(blocks, first_top, next_top, bottom, leading, block_gap=0.0, last_bottom=None, trailer_height=0.0):
+    """
+    Distribui `blocks` (sequências de linhas (x, texto)) pelas páginas e
+    retorna o Layout.
+
+    A primeira linha fica em `first_top` na primeira página e em `next_top`
+    nas seguintes; nenhuma linha fica abaixo de `bottom`. Linhas de um bloco
+    ficam a `leading` pontos umas das outras e os blocos, a mais `block_gap`.
+    Um bloco que cabe em uma página nunca é dividido entre duas. Abaixo do
+    último bloco, `trailer_height` pontos precisam caber acima de
+    `last_bottom` (o rodapé da última página); se não couberem, o último
+    bloco passa para uma nova página junto com eles.
+    """
+    if last_bottom is None:
+        last_bottom = bottom
+    pages = [[]]
+    y = first_top
+    step = leading + block_gap
+    for index, block in enumerate(blocks):
+        height = (len(block) - 1) * leading
+        if index == len(blocks) - 1:
+            # O último bloco leva junto o espaço do rodapé
+            needed, floor = height + step + trailer_height, last_bottom
+        else:
+            needed, floor = height, bottom
+        if pages[-1] and y - needed < floor and next_top - needed >= floor:
+            pages.append([])
+            y = next_top
+        for x, text in block:
+            if y < bottom and pages[-1]: # Bloco maior que uma página inteira
+                pages.append([])
+                y = next_top
+            pages[-1].append((x, y, text))
+            y -= leading
+        y -= block_gap
+    if y - trailer_height < last_bottom:
+        pages.append([])
+        y = next_top
+    return Layout(pages=tuple(tuple(lines) for lines in pages), end_y=y)
+
+
+def draw_lines(c, font, size, lines):
+    """Desenha as linhas (x, y, texto) de uma página em um único objeto de texto."""
+    if not lines:
+        return
+    text = c.beginText()
+    text.setFont(font, size)
+    for x, y, s in lines:
+        text.setTextOrigin(x, y)
+        text.textOut(s)
+    c.drawText(text)
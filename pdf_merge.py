@@ -0,0 +1,266 @@
+"""
+Várias prescrições em um único PDF, escrito página a página.
+
+O canvas do reportlab só serializa o documento em c.save(), com todas as
+páginas em memória. Aqui cada prescrição é desenhada pelos mesmos templates de
+pdf_render em um canvas que não guarda as páginas: render_pages() devolve o
+conteúdo já comprimido de cada página e o MergedPdfWriter o grava na saída
+assim que ele chega, compartilhando um único dicionário de fontes entre todas
+as páginas. Só os números dos objetos e seus offsets (para o xref) ficam em
+memória, então o consumo não cresce com o número de prescrições.
+
+render_pages() só depende dos próprios argumentos: pode rodar nos processos do
+render_engine ou do `batch`, com as páginas juntadas no processo principal.
+Só as 14 fontes padrão do PDF são suportadas (as únicas usadas pelos templates).
+
+O _PageCanvas usa partes internas do canvas do reportlab (CANVAS_INTERNALS),
+por isso a versão do reportlab tem limite superior no pyproject.toml. Antes de
+subir esse limite, rode a verificação:
+
+    python pdf_merge.py --check
+"""
+import io
+import re
+import sys
+import threading
+import time
+import zlib
+
+import reportlab
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen import canvas
+
+from pdf_layout import wrap_text
+from pdf_render import TEMPLATE_DRAWERS
+
+# Objetos fixos; as páginas começam em FIRST_PAGE_OBJECT (conteúdo, página, conteúdo, ...)
+CATALOG_OBJECT = 1
+PAGES_OBJECT = 2
+RESOURCES_OBJECT = 3
+FIRST_PAGE_OBJECT = 4
+
+
+# Atributos internos do canvas.Canvas (e do seu PDFDocument) de que o _PageCanvas depende
+CANVAS_INTERNALS = ("_preamble", "_code", "_pagesize", "_startPage", "_doc", "_doc.fontMapping", "_doc.getInternalFontName")
+
+
+def _missing_internals(c):
+    missing = []
+    for name in CANVAS_INTERNALS:
+        target = c
+        for part in name.split("."):
+            target = getattr(target, part, None)
+        if target is None:
+            missing.append(name)
+    return missing
+
+
+class _PageCanvas(canvas.Canvas):
+    """Canvas que entrega cada página pronta em vez de acumulá-la no documento."""
+
+    def __init__(self):
+        super().__init__(io.BytesIO(), pagesize=letter)
+        missing = _missing_internals(self)
+        if missing:
+            raise RuntimeError(
+                f"O reportlab {reportlab.Version} não tem mais {', '.join(missing)}, usados pelo PDF combinado"
+                " (pdf_merge.py); use uma versão dentro do limite do pyproject.toml."
+            )
+        # Nomes internos (/F1, /F2, ...) na mesma ordem em todos os processos,
+        # para que as páginas de workers diferentes usem o mesmo dicionário de fontes
+        for font_name in pdfmetrics.standardFonts:
+            self._doc.getInternalFontName(font_name)
+        self.pages = []
+
+    def showPage(self):
+        code = [self._preamble] + self._code + [" "]
+        content = ("\n".join(code) + "\n").encode("latin-1")
+        self.pages.append((self._pagesize[0], self._pagesize[1], zlib.compress(content)))
+        self._startPage()
+
+
+_local = threading.local()
+
+
+def _page_canvas():
+    # Um canvas por thread, reaproveitado entre prescrições: showPage() já o
+    # devolve ao estado inicial, e registrar as fontes custa mais que desenhar
+    c = getattr(_local, "canvas", None)
+    if c is None:
+        c = _local.canvas = _PageCanvas()
+    c.pages = []
+    return c
+
+
+def _font_mapping():
+    """Nome interno de cada fonte padrão, na ordem registrada por _PageCanvas."""
+    return _page_canvas()._doc.fontMapping
+
+
+def render_pages(medications, context, timings=None):
+    """
+    Desenha uma prescrição (sempre a partir de uma página nova) e retorna suas
+    páginas como [(largura, altura, conteúdo comprimido), ...]. Com `timings`
+    (dict), guarda os segundos de desenho em timings["draw"].
+    """
+    started = time.perf_counter()
+    c = _page_canvas()
+    try:
+        TEMPLATE_DRAWERS[context.template](c, medications, context)
+        c.showPage()
+    except BaseException:
+        _local.canvas = None # Descarta a página pela metade
+        raise
+    if set(c._doc.fontMapping) != set(pdfmetrics.standardFonts):
+        raise ValueError("O PDF combinado só suporta as fontes padrão do PDF.")
+    if timings is not None:
+        timings["draw"] = time.perf_counter() - started
+    return c.pages
+
+
+def error_pages(message):
+    """
+    Uma página no lugar de uma prescrição que não pôde ser renderizada, com a
+    mensagem de erro, no mesmo formato de render_pages().
+    """
+    c = _page_canvas()
+    margin = 72
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(margin, letter[1] - margin, "Prescrição não gerada")
+    c.setFont("Helvetica", 11)
+    y = letter[1] - margin - 24
+    for line in wrap_text(message, "Helvetica", 11, letter[0] - 2 * margin)[:40]:
+        c.drawString(margin, y, line)
+        y -= 14
+    c.showPage()
+    return c.pages
+
+
+class MergedPdfWriter:
+    """
+    Grava um PDF com várias prescrições chamando `write(bytes)` à medida que
+    as páginas chegam de add_pages(). close() grava as fontes, a árvore de
+    páginas e o xref; até lá, o arquivo está incompleto.
+    """
+
+    def __init__(self, write):
+        self._write = write
+        self._position = 0
+        self._offsets = {}
+        self._page_objects = []
+        self._next_object = FIRST_PAGE_OBJECT
+        self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    @property
+    def page_count(self):
+        return len(self._page_objects)
+
+    def _emit(self, data):
+        self._write(data)
+        self._position += len(data)
+
+    def _object(self, number, body, stream=None):
+        self._offsets[number] = self._position
+        data = b"%d 0 obj\n%s\n" % (number, body)
+        if stream is not None:
+            data += b"stream\n" + stream + b"\nendstream\n"
+        self._emit(data + b"endobj\n")
+
+    def add_pages(self, pages):
+        """Grava as páginas de uma prescrição (de render_pages) e retorna o número da primeira."""
+        first_page = self.page_count + 1
+        for width, height, content in pages:
+            content_object = self._next_object
+            page_object = content_object + 1
+            self._next_object += 2
+            self._object(content_object, b"<< /Length %d /Filter /FlateDecode >>" % len(content), content)
+            self._object(page_object, (
+                f"<< /Type /Page /Parent {PAGES_OBJECT} 0 R /MediaBox [0 0 {width:g} {height:g}]"
+                f" /Resources {RESOURCES_OBJECT} 0 R /Contents {content_object} 0 R >>"
+            ).encode("ascii"))
+            self._page_objects.append(page_object)
+        return first_page
+
+    def add(self, medications, context):
+        """Desenha e grava uma prescrição neste processo; retorna o número da primeira página."""
+        return self.add_pages(render_pages(medications, context))
+
+    def close(self):
+        fonts = []
+        for font_name, internal_name in _font_mapping().items():
+            encoding = " /Encoding /WinAnsiEncoding" if pdfmetrics.getFont(font_name).encName == "WinAnsiEncoding" else ""
+            fonts.append(f"{internal_name} << /Type /Font /Subtype /Type1 /BaseFont /{font_name}{encoding} >>")
+        self._object(RESOURCES_OBJECT, (
+            "<< /Font << " + " ".join(fonts) + " >> /ProcSet [/PDF /Text] >>"
+        ).encode("ascii"))
+        kids = " ".join(f"{number} 0 R" for number in self._page_objects)
+        self._object(PAGES_OBJECT, f"<< /Type /Pages /Kids [{kids}] /Count {self.page_count} >>".encode("ascii"))
+        self._object(CATALOG_OBJECT, f"<< /Type /Catalog /Pages {PAGES_OBJECT} 0 R >>".encode("ascii"))
+
+        xref_position = self._position
+        size = self._next_object
+        xref = [b"xref\n0 %d\n" % size, b"0000000000 65535 f \n"]
+        xref.extend(b"%010d 00000 n \n" % self._offsets[number] for number in range(1, size))
+        xref.append(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, CATALOG_OBJECT, xref_position))
+        self._emit(b"".join(xref))
+
+
+def iter_merged_pdf(prescriptions):
+    """
+    Gera os bytes de um PDF com todas as `prescriptions` ((medications,
+    RenderContext), ...), um bloco por prescrição, desenhando neste processo.
+    """
+    chunks = []
+    writer = MergedPdfWriter(chunks.append)
+    for medications, context in prescriptions:
+        writer.add(medications, context)
+        yield b"".join(chunks)
+        chunks.clear()
+    writer.close()
+    yield b"".join(chunks)
+
+
+def check():
+    """
+    Verifica o PDF combinado com o reportlab instalado: as partes internas do
+    canvas, a estrutura do arquivo (offsets do xref) e se cada prescrição tem
+    as mesmas páginas que no render_pdf. Retorna a lista de problemas.
+    """
+    from medparser import parse
+    from pdf_render import render_pdf
+    from render_context import TEMPLATE_FILENAMES, RenderContext
+
+    problems = [f"atributo ausente: {name}" for name in _missing_internals(canvas.Canvas(io.BytesIO()))]
+    if problems:
+        return problems
+    medications = parse("!MED " + "DIPIRONA 500MG 1 comprimido a cada 6 horas; " * 30 + "AAS 100MG 1 ao dia").medications
+    prescriptions = [(medications[:count], RenderContext(template=template))
+                     for template in TEMPLATE_FILENAMES for count in (1, len(medications))]
+    data = b"".join(iter_merged_pdf(prescriptions))
+
+    expected_pages = sum(len(re.findall(rb"/Type /Page\b", render_pdf(*prescription))) for prescription in prescriptions)
+    if data.count(b"/Type /Page ") != expected_pages:
+        problems.append(f"{data.count(b'/Type /Page ')} páginas no PDF combinado, {expected_pages} no render_pdf")
+    if not data.startswith(b"%PDF-") or not data.endswith(b"%%EOF\n"):
+        problems.append("cabeçalho ou final do PDF inválido")
+    xref = data.rindex(b"\nxref\n") + 1
+    size = int(data[xref:].split(b"\n")[1].split()[1])
+    offsets = data[xref:].split(b"\n")[3:2 + size]
+    for number, entry in enumerate(offsets, start=1):
+        if not data.startswith(b"%d 0 obj\n" % number, int(entry[:10])):
+            problems.append(f"offset errado no xref para o objeto {number}")
+    for name in pdfmetrics.standardFonts:
+        if f"/BaseFont /{name}".encode("ascii") not in data:
+            problems.append(f"fonte ausente do dicionário de recursos: {name}")
+    return problems
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--check":
+        problems = check()
+        for problem in problems:
+            print(problem)
+        print(f"{'OK' if not problems else 'FALHOU'}: reportlab {reportlab.Version}, {len(problems)} problema(s)")
+        sys.exit(1 if problems else 0)
+    print(__doc__)
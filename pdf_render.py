@@ -0,0 +1,202 @@
+"""
+Geração dos PDFs das prescrições (reportlab).
+
+Importado sob demanda: comandos que não geram PDF (status, stop, parsing) não
+pagam o custo de carregar o reportlab.
+"""
+import io
+import time
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+from reportlab.lib.units import inch
+
+import template_layers as layers
+from pdf_layout import draw_lines, paginate, text_width, wrap_text
+from medparser import format_medication_text
+from render_context import RenderContext, TEMPLATE_FILENAMES
+
+def _open_canvas(filename):
+    """
+    Opens a canvas writing to `filename`, or to an in-memory buffer when
+    `filename` is None.
+    """
+    target = io.BytesIO() if filename is None else filename
+    return canvas.Canvas(target, pagesize=letter), target
+
+def _close_canvas(c, target, filename, timings=None):
+    """
+    Saves the canvas and returns the PDF bytes (in memory) or the filename
+    written. The time spent in c.save() goes to timings["save"] when given.
+    """
+    if timings is None:
+        c.save()
+    else:
+        started = time.perf_counter()
+        c.save()
+        timings["save"] = time.perf_counter() - started
+    if filename is None:
+        return target.getvalue()
+    print(f"PDF gerado com sucesso: {filename}")
+    return filename
+
+def layout_memed_like(medications):
+    """
+    Plans the medication list of the memed layout (pdf_layout.Layout): each
+    medication wrapped to the page width, kept on a single page when it fits,
+    with the signature and the buyer/supplier boxes below the last one.
+    """
+    font, size = layers.MEMED_MEDICATION_FONT
+    max_width = layers.RIGHT_MARGIN - layers.LEFT_MARGIN
+    blocks = [
+        [(layers.LEFT_MARGIN, line) for line in wrap_text(format_medication_text(med), font, size, max_width)]
+        for med in medications
+    ]
+    return paginate(
+        blocks,
+        first_top=layers.MEDICATIONS_START_Y,
+        next_top=layers.MEMED_CONTINUATION_TOP,
+        bottom=layers.MEMED_MEDICATIONS_BOTTOM,
+        leading=layers.MEMED_LINE_LEADING,
+        block_gap=layers.MEMED_MEDICATION_GAP,
+        last_bottom=layers.MEMED_LAST_PAGE_BOTTOM,
+        trailer_height=layers.SIGNATURE_HEIGHT,
+    )
+
+def draw_memed_like(c, medications, context):
+    """
+    Draws the controlled-prescription layout on `c`, starting on its current
+    page. The last page is left open: the caller saves the canvas or starts
+    the next prescription with c.showPage().
+
+    The fixed parts of the page come from the precompiled layers in
+    template_layers and the medication pages from layout_memed_like; only the
+    per-prescription content is drawn here.
+    """
+    plan = layout_memed_like(medications)
+    layers.memed_first_page_layer().draw(c)
+
+    # --- IDENTIFICAÇÃO DO EMITENTE ---
+    emitter = context.emitter
+    c.setFont("Helvetica", 8)
+    text_x = layers.EMITTER_BOX_X + 5
+    text_y = layers.EMITTER_BOX_Y + layers.BOX_HEIGHT - 35
+    c.drawString(text_x, text_y, f"Nome: {emitter.get('nome', '')}")
+    c.drawString(text_x, text_y - 10, f"CRM: {emitter.get('crm', '')}")
+    c.drawString(text_x, text_y - 20, f"Endereço: {emitter.get('endereco', '')}")
+    c.drawString(text_x, text_y - 30, f"Telefone: {emitter.get('telefone', '')}")
+    c.drawString(text_x, text_y - 40, f"Cidade e UF: {emitter.get('cidade_uf', '')}")
+
+    # --- RECEITUÁRIO CONTROLE ESPECIAL ---
+    c.drawString(layers.RECEITUARIO_BOX_X + 5, layers.RECEITUARIO_BOX_Y + layers.BOX_HEIGHT - 35, f"DATA: {context.date_str}")
+
+    # --- Patient Information ---
+    patient = context.patient
+    patient_y = layers.PATIENT_Y
+    c.setFont("Helvetica", 9)
+    c.drawString(layers.LEFT_MARGIN, patient_y, patient.get('nome', ''))
+    c.drawString(layers.LEFT_MARGIN, patient_y - 10, f"CPF: {patient.get('cpf', '')}")
+    c.drawString(layers.LEFT_MARGIN, patient_y - 20, f"Endereço: {patient.get('endereco', '')}")
+
+    # --- Medications Section ---
+    font, size = layers.MEMED_MEDICATION_FONT
+    for page_number, lines in enumerate(plan.pages):
+        if page_number:
+            c.showPage()
+        draw_lines(c, font, size, lines)
+
+    # --- ASSINATURA Section ---
+    signature_y = plan.end_y - layers.SIGNATURE_OFFSET
+    c.line(layers.PAGE_WIDTH / 2 - 1 * inch, signature_y, layers.PAGE_WIDTH / 2 + 1 * inch, signature_y)
+    c.setFont("Helvetica", 8)
+    c.drawString(layers.PAGE_WIDTH / 2 - 0.5 * inch, signature_y - 10, "ASSINATURA")
+
+    # --- Comprador, Fornecedor e rodapé ---
+    layers.memed_last_page_layer().draw(c)
+
+def generate_memed_like_pdf(medications, filename="prescricao_memed.pdf", context=None, timings=None):
+    """
+    Generates the controlled-prescription layout. Pass filename=None to render
+    into memory and get the PDF bytes back instead of writing a file.
+    """
+    context = context or RenderContext(template="memed")
+    c, target = _open_canvas(filename)
+    draw_memed_like(c, medications, context)
+    return _close_canvas(c, target, filename, timings)
+
+def layout_simple(medications):
+    """
+    Plans the numbered medication list of the simple layout: wrapped lines
+    are indented under the text, past the "N. " number.
+    """
+    font, size = layers.SIMPLE_MEDICATION_FONT
+    blocks = []
+    for i, med in enumerate(medications):
+        number = f"{i+1}. "
+        indent = inch + text_width(number, font, size)
+        lines = wrap_text(format_medication_text(med), font, size, layers.RIGHT_MARGIN - indent)
+        blocks.append([(inch, number + lines[0])] + [(indent, line) for line in lines[1:]])
+    return paginate(
+        blocks,
+        first_top=layers.SIMPLE_MEDICATIONS_START_Y,
+        next_top=layers.SIMPLE_CONTINUATION_TOP,
+        bottom=layers.BOTTOM_MARGIN,
+        leading=layers.SIMPLE_LINE_LEADING,
+        block_gap=layers.SIMPLE_MEDICATION_GAP,
+    )
+
+def draw_simple(c, medications, context):
+    """Draws the simple layout on `c`, starting on its current page (see draw_memed_like)."""
+    plan = layout_simple(medications)
+    layers.simple_first_page_layer().draw(c)
+
+    emitter = context.emitter
+    c.setFont("Helvetica", 12)
+    y_pos = layers.SIMPLE_HEADER_Y
+    c.drawString(inch, y_pos, f"Dr(a). {emitter.get('nome', '')}")
+    c.drawString(inch, y_pos - 20, f"CRM: {emitter.get('crm', '')}")
+    c.drawString(inch, y_pos - 40, f"Data: {context.date_str}")
+
+    font, size = layers.SIMPLE_MEDICATION_FONT
+    for page_number, lines in enumerate(plan.pages):
+        if page_number:
+            c.showPage()
+        draw_lines(c, font, size, lines)
+
+def generate_simple_pdf(medications, filename="prescricao_simple.pdf", context=None, timings=None):
+    """
+    Generates the simple layout. Pass filename=None to render into memory and
+    get the PDF bytes back instead of writing a file.
+    """
+    context = context or RenderContext(template="simple")
+    c, target = _open_canvas(filename)
+    draw_simple(c, medications, context)
+    return _close_canvas(c, target, filename, timings)
+
+# Templates disponíveis e seus geradores / nomes de arquivo padrão
+PDF_TEMPLATES = {
+    "memed": (generate_memed_like_pdf, TEMPLATE_FILENAMES["memed"]),
+    "simple": (generate_simple_pdf, TEMPLATE_FILENAMES["simple"]),
+}
+
+# Funções que desenham cada template em um canvas já aberto (usadas pelo pdf_merge)
+TEMPLATE_DRAWERS = {
+    "memed": draw_memed_like,
+    "simple": draw_simple,
+}
+
+def render_pdf(medications, context, filename=None, timings=None):
+    """
+    Renders `medications` with the template named in `context`. Returns the PDF
+    bytes when `filename` is None, otherwise writes the file and returns its name.
+
+    When `timings` is a dict, the seconds spent drawing on the canvas and in
+    c.save() are stored in timings["draw"] and timings["save"].
+    """
+    generator, _ = PDF_TEMPLATES[context.template]
+    if timings is None:
+        return generator(medications, filename=filename, context=context)
+    started = time.perf_counter()
+    result = generator(medications, filename=filename, context=context, timings=timings)
+    timings["draw"] = time.perf_counter() - started - timings["save"]
+    return result
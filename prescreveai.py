@@ -1,327 +1,68 @@
 #!/usr/bin/env python3
 import json
-import re
 import sys
-import subprocess
 import os
-import signal # Import for signal.SIGTERM
-import time # Import for time.sleep
 
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
-from datetime import date
-
-# Variável global para armazenar os dados do emitente na sessão
-# Esta variável será preenchida pelo api_server.py quando usado como API
-EMITTER_DATA = {}
-
-# PID file for the server process
-PID_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.pid")
+# Parsing, rendering (reportlab) and server management are loaded only by the
+# commands that use them, so `status`, `stop` or `install` start fast. These
+# names stay importable from here for existing callers.
+_LAZY_ATTRIBUTES = {
+    "format_medication_text": "medparser",
+    "RenderContext": "render_context",
+    "DEFAULT_PATIENT": "render_context",
+    "TEMPLATE_FILENAMES": "render_context",
+    "generate_memed_like_pdf": "pdf_render",
+    "generate_simple_pdf": "pdf_render",
+    "render_pdf": "pdf_render",
+    "PDF_TEMPLATES": "pdf_render",
+    "start_server": "server_control",
+    "stop_server": "server_control",
+    "reload_server": "server_control",
+    "server_status": "server_control",
+    "start_daemon": "server_control",
+    "stop_daemon": "server_control",
+    "daemon_status": "server_control",
+    "PID_FILE": "server_control",
+    "DAEMON_PID_FILE": "server_control",
+}
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        import importlib
+        return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def parse_medication_string(input_string):
     """
     Parses a medication string and returns a list of medication dictionaries.
     Expected format: !MED NOME DOSAGEM [COMENTARIO] POSOLOGIA; NOME DOSAGEM POSOLOGIA
-    """
-    if not input_string.startswith("!MED "):
-        return {"error": "Input must start with '!MED '"}
-
-    medications_raw = input_string[len("!MED "):].strip()
-    medication_items = medications_raw.split(';')
-
-    parsed_medications = []
-    for item in medication_items:
-        item = item.strip()
-        if not item:
-            continue
-
-        # Regex to capture name, dosage, optional comment, and posology
-        # Name: anything until a number (start of dosage)
-        # Dosage: number + unit (e.g., 500MG, 0.5ML)
-        # Comment: optional, enclosed in []
-        # Posology: remaining part of the string
-        match = re.match(r"^(.*?)\s+(\d+\.?\d*(?:MG|ML|G|MCG|UI|MG/ML|GOTAS|COMPRIMIDOS|CÁPSULAS|%))\s*(?:\\[(.*?)\\])?\s*(.*)$", item, re.IGNORECASE)
-
-        if match:
-            name = match.group(1).strip().upper()
-            dosage = match.group(2).strip().upper()
-            comment = match.group(3)
-            posology = match.group(4).strip().upper()
-
-            if comment:
-                comment = comment.strip().upper()
-
-            # Basic validation
-            if not name:
-                return {"error": f"Medication name cannot be empty in: {item}"}
-            if not re.search(r'\d', dosage):
-                return {"error": f"Dosage must contain at least one number in: {item}"}
-            if not posology:
-                return {"error": f"Posology cannot be empty in: {item}"}
-
-            parsed_medications.append({
-                "nome": name,
-                "dosagem": dosage,
-                "comentario": comment,
-                "posologia": posology
-            })
-        else:
-            return {"error": f"Could not parse medication item: {item}"}
-    
-    if not parsed_medications:
-        return {"error": "No valid medications found in input."}
-
-    return {"medicacoes": parsed_medications}
-
-def format_medication_text(medication):
-    """Formats a single medication dictionary into a human-readable string for PDF."""
-    name = medication['nome'].title() # Title case for better readability in PDF
-    dosage = medication['dosagem'].upper()
-    comment = medication['comentario']
-    posology = medication['posologia'].capitalize()
-
-    if comment:
-        return f"{name} {dosage} [{comment}] {posology}"
-    else:
-        return f"{name} {dosage} {posology}"
-
-def get_emitter_data():
-    global EMITTER_DATA
-    # Quando usado como API, EMITTER_DATA será preenchido externamente.
-    # Não solicitamos entrada do usuário aqui.
-    return EMITTER_DATA
-
-def generate_memed_like_pdf(medications, filename="prescricao_memed.pdf"):
-    c = canvas.Canvas(filename, pagesize=letter)
-    width, height = letter
-
-    # Margins
-    left_margin = inch
-    right_margin = width - inch
-    top_margin = height - inch
-    bottom_margin = inch
-
-    # Fonts
-    c.setFont("Helvetica", 10)
-
-    # --- Header Section (SYNAPSI, Doctor Name, CRM) ---
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(left_margin, top_margin, "SYNAPSI") # Placeholder for logo
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(left_margin + 1.5 * inch, top_margin, "Dr. André Batista Millet Neves")
-    c.setFont("Helvetica", 10)
-    c.drawString(left_margin + 1.5 * inch, top_margin - 15, "Neurologia - CRM 52946788")
-
-    # --- IDENTIFICAÇÃO DO EMITENTE Section ---
-    emitter_box_x = left_margin
-    emitter_box_y = top_margin - 0.7 * inch - 70 # Adjusted y-position
-    emitter_box_width = 3.5 * inch
-    emitter_box_height = 1.2 * inch
-    c.rect(emitter_box_x, emitter_box_y, emitter_box_width, emitter_box_height)
-
-    c.setFont("Helvetica-Bold", 9)
-    c.drawString(emitter_box_x + 5, emitter_box_y + emitter_box_height - 15, "IDENTIFICAÇÃO DO EMITENTE")
-    c.line(emitter_box_x, emitter_box_y + emitter_box_height - 20, emitter_box_x + emitter_box_width, emitter_box_y + emitter_box_height - 20)
-
-    emitter = get_emitter_data()
-    c.setFont("Helvetica", 8)
-    text_y = emitter_box_y + emitter_box_height - 35
-    c.drawString(emitter_box_x + 5, text_y, f"Nome: {emitter.get('nome', '')}")
-    c.drawString(emitter_box_x + 5, text_y - 10, f"CRM: {emitter.get('crm', '')}")
-    c.drawString(emitter_box_x + 5, text_y - 20, f"Endereço: {emitter.get('endereco', '')}")
-    c.drawString(emitter_box_x + 5, text_y - 30, f"Telefone: {emitter.get('telefone', '')}")
-    c.drawString(emitter_box_x + 5, text_y - 40, f"Cidade e UF: {emitter.get('cidade_uf', '')}")
-
-    # --- RECEITUÁRIO CONTROLE ESPECIAL Section ---
-    receituario_box_x = left_margin + emitter_box_width + 0.2 * inch
-    receituario_box_y = emitter_box_y
-    receituario_box_width = width - right_margin - receituario_box_x
-    receituario_box_height = emitter_box_height
-    c.rect(receituario_box_x, receituario_box_y, receituario_box_width, receituario_box_height)
-
-    c.setFont("Helvetica-Bold", 9)
-    c.drawString(receituario_box_x + 5, receituario_box_y + receituario_box_height - 15, "RECEITUÁRIO CONTROLE ESPECIAL")
-    c.line(receituario_box_x, receituario_box_y + receituario_box_height - 20, receituario_box_x + receituario_box_width, receituario_box_y + receituario_box_height - 20)
-
-    c.setFont("Helvetica", 8)
-    today = date.today().strftime("%d/%m/%Y")
-    c.drawString(receituario_box_x + 5, receituario_box_y + receituario_box_height - 35, f"DATA: {today}")
-    c.drawString(receituario_box_x + 5, receituario_box_y + receituario_box_height - 45, "1a. via farmácia")
-    c.drawString(receituario_box_x + 5, receituario_box_y + receituario_box_height - 55, "2a. via paciente")
-
-    # --- Patient Information (CLEUZA FERREIRA DE SA) ---
-    patient_y = emitter_box_y - 0.2 * inch - 30 # Adjusted y-position
-    c.setFont("Helvetica", 9)
-    c.drawString(left_margin, patient_y, "CLEUZA FERREIRA DE SA")
-    c.drawString(left_margin, patient_y - 10, "CPF: 280.122.406-53")
-    c.drawString(left_margin, patient_y - 20, "Endereço: AVENIDA LUCIO COSTA, 17710, RIO DE JANEIRO")
-    c.line(left_margin, patient_y - 25, right_margin, patient_y - 25)
-
-    # --- Medications Section ---
-    c.setFont("Helvetica", 9)
-    current_y = patient_y - 0.5 * inch - 20 # Adjusted start for medications
-
-    for i, med in enumerate(medications):
-        med_line = format_medication_text(med)
-        c.drawString(left_margin, current_y, med_line)
-        current_y -= 15 # Line spacing
-        if current_y < bottom_margin + 1.5 * inch: # Check for new page
-            c.showPage()
-            c.setFont("Helvetica", 9)
-            current_y = top_margin - 0.5 * inch # Reset y for new page
-
-    # --- ASSINATURA Section ---
-    signature_y = current_y - 0.5 * inch # Position below medications
-    c.line(width / 2 - 1 * inch, signature_y, width / 2 + 1 * inch, signature_y)
-    c.setFont("Helvetica", 8)
-    c.drawString(width / 2 - 0.5 * inch, signature_y - 10, "ASSINATURA")
-
-    # --- IDENTIFICAÇÃO DO COMPRADOR Section ---
-    comprador_box_x = left_margin
-    comprador_box_y = bottom_margin + 0.5 * inch # Adjusted y-position
-    comprador_box_width = 3.5 * inch
-    comprador_box_height = 1.2 * inch
-    c.rect(comprador_box_x, comprador_box_y, comprador_box_width, comprador_box_height)
-
-    c.setFont("Helvetica-Bold", 9)
-    c.drawString(comprador_box_x + 5, comprador_box_y + comprador_box_height - 15, "IDENTIFICAÇÃO DO COMPRADOR")
-    c.line(comprador_box_x, comprador_box_y + comprador_box_height - 20, comprador_box_x + comprador_box_width, comprador_box_y + comprador_box_height - 20)
-
-    c.setFont("Helvetica", 8)
-    text_y = comprador_box_y + comprador_box_height - 35
-    c.drawString(comprador_box_x + 5, text_y, "Nome:")
-    c.drawString(comprador_box_x + 5, text_y - 10, "RG:")
-    c.drawString(comprador_box_x + 5, text_y - 20, "Endereço:")
-    c.drawString(comprador_box_x + 5, text_y - 30, "Telefone:")
-    c.drawString(comprador_box_x + 5, text_y - 40, "Cidade e UF:")
-
-    # --- IDENTIFICAÇÃO DO FORNECEDOR Section ---
-    fornecedor_box_x = left_margin + comprador_box_width + 0.2 * inch
-    fornecedor_box_y = comprador_box_y
-    fornecedor_box_width = receituario_box_width
-    fornecedor_box_height = comprador_box_height
-    c.rect(fornecedor_box_x, fornecedor_box_y, fornecedor_box_width, fornecedor_box_height)
-
-    c.setFont("Helvetica-Bold", 9)
-    c.drawString(fornecedor_box_x + 5, fornecedor_box_y + fornecedor_box_height - 15, "IDENTIFICAÇÃO DO FORNECEDOR")
-    c.line(fornecedor_box_x, fornecedor_box_y + fornecedor_box_height - 20, fornecedor_box_x + fornecedor_box_width, fornecedor_box_y + fornecedor_box_height - 20)
-
-    c.setFont("Helvetica", 8)
-    text_y = fornecedor_box_y + fornecedor_box_height - 35
-    c.drawString(fornecedor_box_x + 5, text_y, "DATA")
-    c.drawString(fornecedor_box_x + 5, text_y - 10, "ASSINATURA DO FARMACÊUTICO")
-
-    # --- Footer ---
-    c.setFont("Helvetica", 8)
-    c.drawCentredString(width / 2, bottom_margin - 0.2 * inch, "Av.das Américas - 500. Shopping Downtown.")
-    c.drawCentredString(width / 2, bottom_margin - 0.35 * inch, "Bloco 12 sala 207 - Barra da Tijuca")
-
-    c.save()
-    print(f"PDF gerado com sucesso: {filename}")
-
-def generate_simple_pdf(medications, filename="prescricao_simple.pdf"):
-    c = canvas.Canvas(filename, pagesize=letter)
-    width, height = letter
-
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(inch, height - inch, "Prescrição Médica Simples")
-
-    emitter = get_emitter_data()
-    c.setFont("Helvetica", 12)
-    y_pos = height - inch - 0.5 * inch
-    c.drawString(inch, y_pos, f"Dr(a). {emitter.get('nome', '')}")
-    c.drawString(inch, y_pos - 20, f"CRM: {emitter.get('crm', '')}")
-    c.drawString(inch, y_pos - 40, f"Data: {date.today().strftime('%d/%m/%Y')}")
-
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(inch, y_pos - 80, "Medicações:")
-    c.setFont("Helvetica", 12)
-    current_y = y_pos - 100
-
-    for i, med in enumerate(medications):
-        med_line = format_medication_text(med)
-        c.drawString(inch, current_y, f"{i+1}. {med_line}")
-        current_y -= 20
-        if current_y < inch: # New page if content goes too low
-            c.showPage()
-            c.setFont("Helvetica", 12)
-            current_y = height - inch
-
-    c.save()
-    print(f"PDF gerado com sucesso: {filename}")
-
-# --- Server Management Functions ---
-def start_server():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    venv_python = os.path.join(script_dir, ".venv", "bin", "python3")
-    api_server_path = os.path.join(script_dir, "api_server.py")
-
-    if not os.path.exists(api_server_path):
-        print(f"Erro: api_server.py não encontrado em {api_server_path}")
-        sys.exit(1)
 
-    command = [venv_python, "-m", "uvicorn", "api_server:app", "--reload", "--port", "8000"]
-
-    env = os.environ.copy()
-    env['PYTHONPATH'] = script_dir + os.pathsep + env.get('PYTHONPATH', '')
-
-    print(f"Iniciando servidor FastAPI com: {' '.join(command)}")
-    try:
-        process = subprocess.Popen(command, env=env, preexec_fn=os.setsid) # Use setsid to create a new process group
-        
-        with open(PID_FILE, "w") as f:
-            f.write(str(process.pid))
-        print(f"Servidor FastAPI iniciado em segundo plano (PID: {process.pid}). Acesse http://localhost:8000/docs")
-    except FileNotFoundError:
-        print(f"Erro: interpretador Python ou uvicorn não encontrado em {venv_python}. Certifique-se de que o ambiente virtual está ativado e uvicorn está instalado.")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Erro ao iniciar o servidor FastAPI: {e}")
-        sys.exit(1)
-
-def stop_server():
-    if not os.path.exists(PID_FILE):
-        print("Servidor não está rodando (arquivo PID não encontrado).")
-        return
-
-    with open(PID_FILE, "r") as f:
-        pid = int(f.read().strip())
-
-    try:
-        # Send SIGTERM to the process group to ensure all child processes are killed
-        os.killpg(pid, signal.SIGTERM)
-        print(f"Servidor FastAPI (PID: {pid}) interrompido.")
-    except ProcessLookupError:
-        print(f"Servidor FastAPI (PID: {pid}) não encontrado ou já encerrado.")
-    except Exception as e:
-        print(f"Erro ao tentar parar o servidor: {e}")
-    finally:
-        if os.path.exists(PID_FILE):
-            os.remove(PID_FILE)
-
-def server_status():
-    if not os.path.exists(PID_FILE):
-        print("Servidor não está rodando (arquivo PID não encontrado).")
-        return
-
-    with open(PID_FILE, "r") as f:
-        pid = int(f.read().strip())
+    Returns {"medicacoes": [...]} or {"error": ...} with the first problem found;
+    use medparser.parse() to get every item error at once.
+    """
+    import medparser
+    return medparser.parse(input_string).to_dict()
 
+def _ask_daemon(request, *args):
+    """
+    Calls daemon.parse or daemon.render. Returns None when the daemon is not
+    running or fails (an error reply or a truncated one), so the caller does
+    the work in-process instead.
+    """
+    import prescreveai_daemon as daemon
     try:
-        # Sending signal 0 checks if the process exists without killing it
-        os.kill(pid, 0)
-        print(f"Servidor FastAPI está rodando com PID: {pid}.")
-    except ProcessLookupError:
-        print(f"Servidor FastAPI (PID: {pid}) não está rodando (processo não encontrado).")
-        if os.path.exists(PID_FILE):
-            os.remove(PID_FILE) # Clean up stale PID file
-    except Exception as e:
-        print(f"Erro ao verificar status do servidor: {e}")
+        return request(*args)
+    except (daemon.DaemonError, json.JSONDecodeError) as e:
+        print(f"Aviso: o daemon falhou ({e}); processando localmente.", file=sys.stderr)
+        return None
 
 # --- CLI Logic ---
 def run_cli():
     import io # Import here to avoid circular dependency with sys.stdin/stdout
+    import medparser
+    import prescreveai_daemon as daemon
+    from medparser import format_medication_text
+    from render_context import RenderContext, TEMPLATE_FILENAMES
 
     print("Bem-vindo ao PrescreveAI CLI!")
     print("Digite a linha de medicação (ex: !MED AMITRIPTILINA 25MG NOITE; ALPRAZOLAM 2MG NOITE;)")
@@ -345,35 +86,52 @@ def run_cli():
             break
         elif user_input.lower().startswith("imprimir"):
             parts = user_input.lower().split()
+            # `imprimir [template] --profile` gera também um perfil (cProfile) da renderização
+            profile = "--profile" in parts
+            parts = [part for part in parts if part != "--profile"]
             template_name = "memed" # Default template
             if len(parts) > 1:
                 template_name = parts[1]
 
             if last_parsed_medications:
-                # Temporarily set EMITTER_DATA for CLI interactive use
-                # This will be overwritten by API calls
-                global EMITTER_DATA
-                EMITTER_DATA = {}
-                # get_emitter_data() will now prompt the user
-
-                if template_name == "memed":
-                    generate_memed_like_pdf(last_parsed_medications)
-                elif template_name == "simple":
-                    generate_simple_pdf(last_parsed_medications)
-                else:
+                if template_name not in TEMPLATE_FILENAMES:
                     print(f"Template desconhecido: {template_name}. Usando o template padrão (memed).")
-                    generate_memed_like_pdf(last_parsed_medications)
+                    template_name = "memed"
+
+                context = RenderContext(template=template_name)
+                default_filename = TEMPLATE_FILENAMES[template_name]
+                if profile:
+                    # Renderiza aqui mesmo, e não no daemon, para que o perfil cubra o trabalho
+                    import profiling
+                    from pdf_render import render_pdf
+                    profiler = profiling.Profiler()
+                    with profiler:
+                        pdf_bytes = render_pdf(last_parsed_medications, context)
+                    profile_id = profiler.save("imprimir")
+                    print(f"Perfil salvo em: {profiling.profile_path(profile_id)}")
+                else:
+                    pdf_bytes = _ask_daemon(daemon.render, last_parsed_medications, context)
+                if pdf_bytes is None:
+                    from pdf_render import render_pdf
+                    pdf_bytes = render_pdf(last_parsed_medications, context)
+                with open(default_filename, "wb") as f:
+                    f.write(pdf_bytes)
+                print(f"PDF gerado com sucesso: {default_filename}")
+                _record_history(last_parsed_medications, context, pdf_bytes, default_filename)
             else:
                 print("Nenhuma medicação processada para imprimir. Por favor, insira uma prescrição primeiro.")
             continue
         elif not user_input:
             continue
 
-        result = parse_medication_string(user_input)
+        # Usa o daemon quente quando ele está rodando; senão faz o parsing aqui mesmo
+        parsed = _ask_daemon(daemon.parse, user_input) or medparser.parse(user_input)
 
-        if "error" in result:
-            print(f"Erro: {result['error']}")
+        if parsed.errors:
+            for error in parsed.errors:
+                print(f"Erro: {error.message}")
         else:
+            result = parsed.to_dict()
             last_parsed_medications = result['medicacoes'] # Armazena para uso futuro
 
             print("\n--- Saída Formatada ---")
@@ -385,6 +143,328 @@ def run_cli():
             print(json.dumps(result, indent=2, ensure_ascii=False))
             print("--------------------\n")
 
+def _record_history(medications, context, pdf_bytes, output_path, source="cli", repeated_from=None):
+    """Grava a prescrição emitida no histórico local e mostra seu id (usado por `prescreveai repetir`)."""
+    from history_store import HistoryStore
+    try:
+        history_id = HistoryStore().record(medications, context, pdf_bytes, os.path.abspath(output_path), source, repeated_from)
+    except Exception as e:
+        # O PDF já foi gravado: uma falha do histórico (banco travado, disco cheio) só gera um aviso
+        print(f"Aviso: não foi possível gravar no histórico: {e}", file=sys.stderr)
+        return None
+    if history_id is not None:
+        print(f"Registrada no histórico: #{history_id}")
+    return history_id
+
+# --- Batch Mode ---
+def _render_batch_record(numbered_line):
+    """
+    Processes one JSONL record of `prescreveai batch` and returns its status
+    dict. Runs inside the worker processes, so it never raises.
+
+    The status carries the stage timings under "_metrics" (template, timings)
+    for `--metrics` and, for rendered records, the history entry under
+    "_history"; run_batch removes them before printing. With no output_dir
+    (`batch --merge`), the rendered pages go back under "_pages" instead of
+    being written to a file.
+    """
+    import medparser
+    import metrics
+
+    line_number, line, output_dir = numbered_line
+    status = {"line": line_number}
+    timer = metrics.StageTimer()
+    template = None
+    try:
+        record = json.loads(line)
+        template = record.get("template", "memed")
+        with timer.stage("parse"):
+            parsed = medparser.parse(record["medication_string"])
+        if parsed.errors:
+            raise ValueError(parsed.errors[0].message)
+        medications = parsed.medications
+
+        from pdf_render import render_pdf
+        from render_context import RenderContext, TEMPLATE_FILENAMES
+
+        if template not in TEMPLATE_FILENAMES:
+            raise ValueError(f"Template desconhecido: {template}")
+
+        context_args = {"emitter": record.get("emitter_data") or {}, "template": template}
+        if record.get("patient_data"):
+            context_args["patient"] = record["patient_data"]
+        context = RenderContext(**context_args)
+        from history_store import output_hash
+        from pdf_cache import cache_key
+        # As chaves do histórico são calculadas aqui, nos workers; o processo principal só grava
+        history_entry = {
+            "medications": medications,
+            "context": context,
+            "render_key": cache_key(medications, context),
+            "source": "batch",
+        }
+        if output_dir is None:
+            from pdf_merge import render_pages
+            status.update(status="ok", medicacoes=len(medications))
+            status["_pages"] = render_pages(medications, context, timings=timer.timings)
+            status["_metrics"] = (template, timer.timings)
+            status["_history"] = history_entry
+            return status
+        pdf_bytes = render_pdf(medications, context, timings=timer.timings)
+
+        with timer.stage("write"):
+            output = os.path.join(output_dir, record.get("output") or f"prescricao_{line_number:05d}_{template}.pdf")
+            os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+            with open(output, "wb") as f:
+                f.write(pdf_bytes)
+        status.update(status="ok", output=output, medicacoes=len(medications))
+        history_entry.update(output_hash=output_hash(pdf_bytes), output_path=os.path.abspath(output))
+        status["_history"] = history_entry
+    except json.JSONDecodeError as e:
+        status.update(status="error", error=f"JSON inválido: {e}")
+    except KeyError as e:
+        status.update(status="error", error=f"Campo obrigatório ausente: {e}")
+    except Exception as e:
+        status.update(status="error", error=str(e))
+
+    status["_metrics"] = (template, timer.timings)
+    return status
+
+def _profiled_batch_record(profiled_line):
+    """_render_batch_record sob o cProfile, gravando o perfil parcial no caminho recebido."""
+    import profiling
+    numbered_line, profile_path = profiled_line
+    return profiling.call_profiled(profile_path, _render_batch_record, numbered_line)
+
+# Registros do `batch` gravados no histórico por transação
+HISTORY_BATCH_SIZE = 200
+
+def run_batch(argv):
+    """
+    Non-interactive bulk mode: reads JSONL records (medication_string,
+    emitter_data, patient_data, template, output) and renders them on a
+    process pool, printing one JSON status line per record. With --merge, all
+    records go, in input order, into a single PDF written as pages arrive.
+    Rendered records are added to the prescription history in batches.
+    """
+    import argparse
+    import multiprocessing
+    from history_store import HistoryStore
+
+    arg_parser = argparse.ArgumentParser(prog="prescreveai batch", description="Gera PDFs em lote a partir de um arquivo JSONL.")
+    arg_parser.add_argument("input", nargs="?", default="-", help="arquivo JSONL (padrão: stdin)")
+    arg_parser.add_argument("-o", "--output-dir", default=".", help="diretório dos PDFs gerados (padrão: diretório atual)")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="número de processos (padrão: número de CPUs)")
+    arg_parser.add_argument("--metrics", metavar="ARQUIVO", help="grava os tempos por estágio neste arquivo, no formato do Prometheus")
+    arg_parser.add_argument("--profile", action="store_true", help="gera um perfil (cProfile) de todos os registros, em um único arquivo pstats")
+    arg_parser.add_argument("--merge", metavar="ARQUIVO", help="junta todas as prescrições, na ordem da entrada, em um único PDF")
+    args = arg_parser.parse_args(argv)
+
+    input_file = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output_dir = None if args.merge else args.output_dir
+    records = (
+        (line_number, line, output_dir)
+        for line_number, line in enumerate(input_file, start=1)
+        if line.strip()
+    )
+
+    merged_file = merged = None
+    if args.merge:
+        from pdf_merge import MergedPdfWriter
+        merged_file = open(args.merge, "wb")
+        merged = MergedPdfWriter(merged_file.write)
+
+    if args.metrics:
+        import metrics
+
+    worker = _render_batch_record
+    if args.profile:
+        # Cada registro gera um perfil parcial no worker; no fim, todos viram um único arquivo
+        import profiling
+        profiler = profiling.Profiler()
+        worker = _profiled_batch_record
+        records = ((record, profiler.partial_path()) for record in records)
+
+    history = HistoryStore()
+    history_entries = []
+
+    def flush_history():
+        try:
+            history.record_many(history_entries)
+        except Exception as e:
+            # Os PDFs já foram gerados: o lote continua, só sem essas entradas no histórico
+            print(f"Aviso: não foi possível gravar {len(history_entries)} registro(s) no histórico: {e}", file=sys.stderr)
+        history_entries.clear()
+
+    def emit(statuses):
+        failures = 0
+        for status in statuses:
+            template, timings = status.pop("_metrics")
+            failures += status["status"] != "ok"
+            if "_pages" in status:
+                status.update(output=args.merge, page=merged.add_pages(status.pop("_pages")))
+                status["_history"]["output_path"] = os.path.abspath(args.merge)
+            if "_history" in status:
+                history_entries.append(status.pop("_history"))
+                if len(history_entries) >= HISTORY_BATCH_SIZE:
+                    flush_history()
+            if args.metrics:
+                template = metrics.template_label(template)
+                metrics.observe_stages(timings, template, status.get("medicacoes", 0))
+                metrics.PRESCRIPTIONS.inc(template, status["status"])
+            print(json.dumps(status, ensure_ascii=False), flush=True)
+        return failures
+
+    try:
+        if args.jobs <= 1:
+            failures = emit(map(worker, records))
+        else:
+            with multiprocessing.Pool(args.jobs) as pool:
+                # No PDF combinado, as prescrições precisam sair na ordem da entrada
+                imap = pool.imap if merged else pool.imap_unordered
+                failures = emit(imap(worker, records, chunksize=4))
+        if merged:
+            merged.close()
+        flush_history()
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if merged_file:
+            merged_file.close()
+
+    if args.metrics:
+        metrics.REGISTRY.write(args.metrics)
+    if args.profile:
+        profile_id = profiler.save("batch")
+        print(f"Perfil salvo em: {profiling.profile_path(profile_id)}", file=sys.stderr)
+    return 1 if failures else 0
+
+# --- Histórico ---
+def _history_arguments(arg_parser):
+    arg_parser.add_argument("--paciente", help="início do nome ou CPF do paciente")
+    arg_parser.add_argument("--crm", help="CRM do emitente")
+    arg_parser.add_argument("--medicamento", help="início do nome de uma das medicações")
+
+def _history_filters(args):
+    filters = {"crm": args.crm, "drug": args.medicamento}
+    if args.paciente:
+        # Só dígitos e pontuação: é um CPF; senão, o início do nome
+        key = "cpf" if not any(ch.isalpha() for ch in args.paciente) else "patient"
+        filters[key] = args.paciente
+    return filters
+
+def _read_if_unchanged(path, expected_hash):
+    """Bytes do arquivo em `path`, se ele ainda tiver o hash `expected_hash`; senão None."""
+    from history_store import output_hash
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    return data if output_hash(data) == expected_hash else None
+
+def run_history(argv):
+    """`prescreveai historico`: lists the most recent prescriptions in the history."""
+    import argparse
+    from history_store import HistoryStore
+
+    arg_parser = argparse.ArgumentParser(prog="prescreveai historico", description="Lista as prescrições emitidas, da mais recente para a mais antiga.")
+    _history_arguments(arg_parser)
+    arg_parser.add_argument("--desde", help="emitidas a partir desta data (AAAA-MM-DD)")
+    arg_parser.add_argument("--ate", help="emitidas até esta data, inclusive (AAAA-MM-DD)")
+    arg_parser.add_argument("-n", "--limite", type=int, default=20, help="número máximo de prescrições (padrão: 20)")
+    arg_parser.add_argument("--json", action="store_true", help="uma linha JSON por prescrição")
+    args = arg_parser.parse_args(argv)
+
+    entries = HistoryStore().search(since=args.desde, until=args.ate, limit=args.limite, **_history_filters(args))
+    for entry in entries:
+        if args.json:
+            print(json.dumps(entry, ensure_ascii=False))
+            continue
+        drugs = ", ".join(medication["nome"] for medication in entry["medicacoes"])
+        print(f"#{entry['id']}  {entry['issue_date']}  {entry['patient'].get('nome', '')}  CRM {entry['emitter'].get('crm') or '-'}  [{entry['template']}]  {drugs}")
+    if not entries and not args.json:
+        print("Nenhuma prescrição encontrada.")
+    return 0
+
+def run_repeat(argv):
+    """
+    `prescreveai repetir`: reissues a prescription from the history (by id, or
+    the most recent one matching the filters) dated today. When nothing that
+    goes into the PDF changed, the previous file or the disk cache is reused
+    instead of rendering again.
+    """
+    import argparse
+    from history_store import HistoryNotFound, HistoryStore, entry_context
+    from pdf_cache import PdfCache, cache_key
+    from render_context import TEMPLATE_FILENAMES
+
+    arg_parser = argparse.ArgumentParser(prog="prescreveai repetir", description="Emite de novo uma prescrição do histórico, com a data de hoje.")
+    arg_parser.add_argument("id", nargs="?", type=int, help="id da prescrição no histórico (padrão: a mais recente que atende aos filtros)")
+    _history_arguments(arg_parser)
+    arg_parser.add_argument("-t", "--template", choices=sorted(TEMPLATE_FILENAMES), help="outro template (padrão: o da prescrição original)")
+    arg_parser.add_argument("-o", "--output", help="arquivo do PDF (padrão: o nome padrão do template, no diretório atual)")
+    args = arg_parser.parse_args(argv)
+
+    history = HistoryStore()
+    if args.id is not None:
+        try:
+            entry = history.get(args.id)
+        except HistoryNotFound:
+            print(f"Erro: a prescrição #{args.id} não está no histórico.")
+            return 1
+    else:
+        entry = history.latest(**_history_filters(args))
+        if entry is None:
+            print("Erro: nenhuma prescrição do histórico atende aos filtros.")
+            return 1
+
+    medications = entry["medicacoes"]
+    context = entry_context(entry, template=args.template)
+    output = os.path.abspath(args.output or TEMPLATE_FILENAMES[context.template])
+    key = cache_key(medications, context)
+
+    pdf_bytes = reused_from = None
+    if key == entry["render_key"] and entry["output_path"] and entry["output_hash"]:
+        # Mesmo conteúdo e mesma data: o arquivo da emissão anterior serve, se não foi alterado
+        pdf_bytes = _read_if_unchanged(entry["output_path"], entry["output_hash"])
+        reused_from = entry["output_path"] if pdf_bytes is not None else None
+    cache = PdfCache(max_entries=0) # Só o nível de disco (PRESCREVEAI_CACHE_DIR) sobrevive entre execuções
+    if pdf_bytes is None:
+        pdf_bytes = cache.get(key)
+        reused_from = "cache" if pdf_bytes is not None else None
+    if pdf_bytes is None:
+        import prescreveai_daemon as daemon
+        pdf_bytes = _ask_daemon(daemon.render, medications, context)
+        if pdf_bytes is None:
+            from pdf_render import render_pdf
+            pdf_bytes = render_pdf(medications, context)
+        cache.put(key, pdf_bytes)
+
+    if reused_from != output:
+        with open(output, "wb") as f:
+            f.write(pdf_bytes)
+    print(f"PDF gerado com sucesso: {output}" + (f" (reaproveitado de {reused_from})" if reused_from else ""))
+    _record_history(medications, context, pdf_bytes, output, source="repetir", repeated_from=entry["id"])
+    return 0
+
+def run_serve(argv):
+    """`prescreveai serve`: parses the server options and starts it in the background."""
+    import argparse
+    import server_control
+
+    arg_parser = argparse.ArgumentParser(prog="prescreveai serve", description="Inicia o servidor da API em segundo plano.")
+    arg_parser.add_argument("-w", "--workers", type=int, default=1, help="número de processos do servidor (padrão: 1)")
+    arg_parser.add_argument("--host", default="127.0.0.1", help="endereço de escuta (padrão: 127.0.0.1)")
+    arg_parser.add_argument("-p", "--port", type=int, default=8000, help="porta (padrão: 8000)")
+    arg_parser.add_argument("--reload", action="store_true", help="modo de desenvolvimento: um worker, recarregado a cada alteração dos arquivos")
+    args = arg_parser.parse_args(argv)
+    if args.reload and args.workers != 1:
+        arg_parser.error("--reload não pode ser combinado com --workers")
+    if args.workers < 1:
+        arg_parser.error("--workers deve ser pelo menos 1")
+    server_control.start_server(host=args.host, port=args.port, workers=args.workers, reload=args.reload)
+
 # --- Install Instructions ---
 def show_install_instructions():
     print("\nBem-vindo ao PrescreveAI!")
@@ -394,6 +474,8 @@ def show_install_instructions():
 
 # --- Update Function ---
 def update_program():
+    import subprocess
+
     script_dir = os.path.dirname(os.path.abspath(__file__))
     install_dir = os.path.abspath(os.path.join(script_dir, "..")) # Assuming installed in /opt/prescreveai
 
@@ -444,16 +526,37 @@ def update_program():
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         command = sys.argv[1]
+        if command in ("stop", "reload", "status", "daemon"):
+            import server_control
         if command == "serve":
-            start_server()
+            run_serve(sys.argv[2:])
+        elif command == "reload":
+            server_control.reload_server()
         elif command == "stop":
-            stop_server()
+            server_control.stop_server()
         elif command == "status":
-            server_status()
+            server_control.server_status()
         elif command == "install":
             show_install_instructions()
         elif command == "update":
             update_program()
+        elif command == "batch":
+            sys.exit(run_batch(sys.argv[2:]))
+        elif command == "historico":
+            sys.exit(run_history(sys.argv[2:]))
+        elif command == "repetir":
+            sys.exit(run_repeat(sys.argv[2:]))
+        elif command == "daemon":
+            action = sys.argv[2] if len(sys.argv) > 2 else "start"
+            if action == "--foreground":
+                import prescreveai_daemon
+                prescreveai_daemon.serve_forever()
+            elif action == "stop":
+                server_control.stop_daemon()
+            elif action == "status":
+                server_control.daemon_status()
+            else:
+                server_control.start_daemon()
         else:
             # Run the interactive CLI for other commands or no command
             run_cli()
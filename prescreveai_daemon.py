@@ -0,0 +1,226 @@
+"""
+Daemon "quente" do PrescreveAI.
+
+Mantém um processo com o parser e o renderizador já carregados, escutando em
+um socket Unix local. A CLI encaminha para ele o parsing e a geração de PDFs
+quando ele está rodando e, caso contrário, faz o trabalho no próprio processo.
+
+Protocolo: uma requisição JSON por linha, uma resposta JSON por linha.
+    {"op": "ping"}
+    {"op": "parse", "text": "!MED ..."}
+    {"op": "render", "medicacoes": [...], "context": RenderContext.to_dict()}
+Respostas: {"ok": true, ...} ou {"ok": false, "error": "..."}.
+
+O ciclo de vida (PID file, start/stop/status) é o mesmo do servidor da API:
+    prescreveai daemon [start|stop|status]
+
+Este módulo não importa o reportlab no lado do cliente.
+"""
+import base64
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+SOCKET_PATH = os.environ.get(
+    "PRESCREVEAI_SOCKET",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "prescreveai.sock"),
+)
+
+# Timeout das chamadas do cliente (segundos)
+CLIENT_TIMEOUT = 30
+
+
+class DaemonError(Exception):
+    """Erro devolvido pelo daemon ao processar uma requisição."""
+
+
+# --- Cliente ---
+
+def call(op, socket_path=None, timeout=CLIENT_TIMEOUT, **payload):
+    """
+    Envia uma requisição ao daemon e devolve a resposta (dict). Retorna None se
+    o daemon não estiver rodando, para que quem chama faça o trabalho localmente.
+    Levanta DaemonError se o daemon responder com erro.
+    """
+    socket_path = socket_path or SOCKET_PATH
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps({"op": op, **payload}).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+    except OSError:
+        # Socket órfão, daemon encerrando ou sem resposta: quem chama faz o trabalho localmente
+        return None
+    if not line:
+        return None
+
+    response = json.loads(line)
+    if not response.get("ok"):
+        raise DaemonError(response.get("error", "erro desconhecido"))
+    return response
+
+
+def is_running(socket_path=None):
+    try:
+        return call("ping", socket_path=socket_path, timeout=1) is not None
+    except (OSError, DaemonError):
+        return False
+
+
+def wait_until_ready(socket_path=None, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if is_running(socket_path):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def parse(text, socket_path=None):
+    """medparser.ParseResult via daemon, ou None se o daemon não estiver rodando."""
+    response = call("parse", socket_path=socket_path, text=text)
+    if response is None:
+        return None
+    import medparser
+    return medparser.ParseResult(
+        medications=[medparser.Medication.from_dict(medication) for medication in response["medicacoes"]],
+        errors=[medparser.ItemError(**error) for error in response["errors"]],
+    )
+
+
+def render(medications, context, socket_path=None):
+    """
+    Bytes do PDF renderizado pelo daemon, ou None se o daemon não estiver
+    rodando. `medications` são registros medparser.Medication ou dicts.
+    """
+    from medparser import Medication
+    medications = [m.to_dict() if isinstance(m, Medication) else m for m in medications]
+    response = call("render", socket_path=socket_path, medicacoes=medications, context=context.to_dict())
+    if response is None:
+        return None
+    return base64.b64decode(response["pdf_base64"])
+
+
+# --- Servidor ---
+
+def _handle(request):
+    import medparser
+
+    op = request.get("op")
+    if op == "ping":
+        return {"ok": True, "pid": os.getpid()}
+    if op == "parse":
+        result = medparser.parse(request["text"])
+        return {"ok": True, "medicacoes": [m.to_dict() for m in result.medications], "errors": [e.to_dict() for e in result.errors]}
+    if op == "render":
+        from pdf_render import render_pdf
+        from render_context import RenderContext, TEMPLATE_FILENAMES
+
+        context = RenderContext.from_dict(request["context"])
+        if context.template not in TEMPLATE_FILENAMES:
+            return {"ok": False, "error": f"Template desconhecido: {context.template}"}
+        pdf_bytes = render_pdf(request["medicacoes"], context)
+        return {"ok": True, "pdf_base64": base64.b64encode(pdf_bytes).decode("ascii")}
+    return {"ok": False, "error": f"Operação desconhecida: {op}"}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = _handle(json.loads(line))
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_forever(socket_path=None):
+    """Carrega parser e renderizador e atende no socket até receber SIGTERM/SIGINT."""
+    import medparser
+    import pdf_render
+    import template_layers
+
+    # Aquecimento: fontes, camadas dos templates e gramática já prontos para a primeira requisição
+    template_layers.compile_layers()
+    pdf_render.generate_simple_pdf([], filename=None)
+
+    socket_path = socket_path or SOCKET_PATH
+    if os.path.exists(socket_path):
+        if is_running(socket_path):
+            raise SystemExit(f"Já existe um daemon respondendo em {socket_path}")
+        os.remove(socket_path) # Socket órfão de uma execução anterior
+
+    server = _DaemonServer(socket_path, _RequestHandler)
+    os.chmod(socket_path, 0o600)
+
+    def shutdown(signum, frame):
+        # shutdown() bloqueia até o loop terminar, então roda fora do handler
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def check():
+    """
+    Sobe o daemon em um socket temporário (em uma thread) e confere, pelo
+    cliente, o parse e o render de cada template com os registros de
+    medparser.parse(). Retorna a lista de problemas.
+    """
+    import tempfile
+    import medparser
+    from render_context import RenderContext, TEMPLATE_FILENAMES
+
+    text = "!MED DIPIRONA 500MG [SE DOR] 1 comprimido a cada 6 horas; AAS 100MG 1 ao dia"
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = os.path.join(tmp_dir, "check.sock")
+        server = _DaemonServer(socket_path, _RequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            parsed = parse(text, socket_path=socket_path)
+            if parsed is None or parsed.to_dict() != medparser.parse(text).to_dict():
+                problems.append("parse: resultado diferente do medparser.parse()")
+            medications = medparser.parse(text).medications
+            for template in TEMPLATE_FILENAMES:
+                pdf_bytes = render(medications, RenderContext(template=template), socket_path=socket_path)
+                if not pdf_bytes or not pdf_bytes.startswith(b"%PDF-"):
+                    problems.append(f"render ({template}): o daemon não devolveu um PDF")
+        except Exception as e:
+            problems.append(f"{type(e).__name__}: {e}")
+        finally:
+            server.shutdown()
+            server.server_close()
+    return problems
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "--check":
+        problems = check()
+        for problem in problems:
+            print(problem)
+        print(f"{'OK' if not problems else 'FALHOU'}: {len(problems)} problema(s) no daemon")
+        sys.exit(1 if problems else 0)
+    print(__doc__)
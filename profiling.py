@@ -0,0 +1,148 @@
+"""
+Perfis (cProfile) de prescrições individuais, sob demanda.
+
+Desligado, não custa nada: nenhum profiler é criado. Ligado (cabeçalho
+`X-Profile: 1` ou `?profile=1` no POST /prescribe, `imprimir --profile` ou
+`batch --profile` na CLI), o trabalho daquela prescrição roda sob o cProfile,
+inclusive a parte feita nos processos do render_engine ou do `batch`, e tudo
+é juntado em um único arquivo pstats:
+
+    PRESCREVEAI_PROFILE_DIR/<id>.pstats
+
+Configuração por variáveis de ambiente:
+    PRESCREVEAI_PROFILE_DIR   diretório dos perfis (padrão: profiles/ ao lado do programa)
+    PRESCREVEAI_PROFILE_KEEP  quantos perfis manter; os mais antigos são apagados (padrão: 50)
+
+Leitura de um perfil:
+    python profiling.py                       # lista os perfis
+    python profiling.py <id> [--sort tottime] # resumo das funções mais caras
+    python -m pstats <arquivo .pstats>        # navegador interativo do pstats
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import time
+import uuid
+
+PROFILE_DIR = os.environ.get("PRESCREVEAI_PROFILE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+PROFILE_KEEP = int(os.environ.get("PRESCREVEAI_PROFILE_KEEP", 50))
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+_PROFILE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[a-z]+-[0-9a-f]{8}$")
+
+
+def profile_path(profile_id, directory=None):
+    """Caminho do arquivo de um perfil. Levanta ValueError para ids malformados."""
+    if not _PROFILE_ID.match(profile_id):
+        raise ValueError(f"Id de perfil inválido: {profile_id}")
+    return os.path.join(directory or PROFILE_DIR, f"{profile_id}.pstats")
+
+
+def call_profiled(path, fn, *args, **kwargs):
+    """Executa `fn` sob o cProfile e grava as estatísticas em `path` (usado nos processos de trabalho)."""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        profiler.dump_stats(path)
+
+
+class Profiler:
+    """
+    Perfil de uma prescrição. O cProfile só fica ligado dentro de `with
+    profiler:`, para não medir outras requisições que o event loop atende
+    enquanto esta aguarda o render_engine. Os processos de trabalho gravam
+    perfis parciais em partial_path(); save() junta tudo em um só arquivo.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or PROFILE_DIR
+        self._profile = cProfile.Profile()
+        self._enabled_once = False
+        self._partials = []
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __enter__(self):
+        self._enabled_once = True
+        self._profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profile.disable()
+
+    def partial_path(self):
+        """Caminho para um perfil parcial gravado por outro processo (call_profiled)."""
+        path = os.path.join(self.directory, f".partial-{uuid.uuid4().hex}.pstats")
+        self._partials.append(path)
+        return path
+
+    def save(self, label):
+        """Junta o perfil deste processo e os parciais em <id>.pstats e retorna o id."""
+        stats = pstats.Stats(self._profile) if self._enabled_once else None
+        for path in self._partials:
+            if not os.path.exists(path):
+                continue # O processo de trabalho falhou antes de gravar
+            if stats is None:
+                stats = pstats.Stats(path)
+            else:
+                stats.add(path)
+            os.remove(path)
+        self._partials = []
+        if stats is None:
+            raise ValueError("Nenhum dado de perfil foi coletado.")
+
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:8]}"
+        stats.dump_stats(profile_path(profile_id, self.directory))
+        prune(self.directory)
+        return profile_id
+
+
+def list_profiles(directory=None):
+    """Perfis guardados, do mais recente para o mais antigo."""
+    directory = directory or PROFILE_DIR
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        profile_id, ext = os.path.splitext(name)
+        if ext != ".pstats" or not _PROFILE_ID.match(profile_id):
+            continue
+        st = os.stat(os.path.join(directory, name))
+        profiles.append({"id": profile_id, "bytes": st.st_size, "created": st.st_mtime})
+    profiles.sort(key=lambda profile: profile["created"], reverse=True)
+    return profiles
+
+
+def prune(directory=None, keep=None):
+    """Apaga os perfis mais antigos, mantendo os `keep` mais recentes."""
+    directory = directory or PROFILE_DIR
+    keep = PROFILE_KEEP if keep is None else keep
+    for profile in list_profiles(directory)[keep:]:
+        try:
+            os.remove(profile_path(profile["id"], directory))
+        except FileNotFoundError:
+            pass
+
+
+def summary(profile_id, sort="cumulative", limit=30, directory=None):
+    """Resumo em texto das `limit` funções mais caras do perfil, ordenadas por `sort`."""
+    output = io.StringIO()
+    stats = pstats.Stats(profile_path(profile_id, directory), stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        for profile in list_profiles():
+            print(f"{profile['id']}  {profile['bytes']:>9} bytes")
+        sys.exit(0)
+    sort = sys.argv[sys.argv.index("--sort") + 1] if "--sort" in sys.argv else "cumulative"
+    print(summary(sys.argv[1], sort=sort))
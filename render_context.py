@@ -0,0 +1,47 @@
+"""
+Contexto de renderização de uma prescrição.
+
+Módulo leve (sem reportlab): a CLI, o daemon e a API montam o contexto sem
+carregar o renderizador, que só é importado quando um PDF é de fato gerado.
+"""
+from dataclasses import dataclass, field
+from datetime import date
+
+# Paciente usado quando nenhum é informado (dados de exemplo do layout memed)
+DEFAULT_PATIENT = {
+    "nome": "CLEUZA FERREIRA DE SA",
+    "cpf": "280.122.406-53",
+    "endereco": "AVENIDA LUCIO COSTA, 17710, RIO DE JANEIRO",
+}
+
+# Templates disponíveis e seus nomes de arquivo padrão
+TEMPLATE_FILENAMES = {
+    "memed": "prescricao_memed.pdf",
+    "simple": "prescricao_simple.pdf",
+}
+
+@dataclass(frozen=True)
+class RenderContext:
+    """
+    Everything a PDF generator needs besides the medication list. Passed
+    explicitly to the generators so rendering has no shared module state and
+    can run concurrently in threads or processes.
+    """
+    emitter: dict = field(default_factory=dict)
+    patient: dict = field(default_factory=lambda: dict(DEFAULT_PATIENT))
+    template: str = "memed"
+    issue_date: date = field(default_factory=date.today)
+
+    @property
+    def date_str(self):
+        return self.issue_date.strftime("%d/%m/%Y")
+
+    def to_dict(self):
+        return {"emitter": self.emitter, "patient": self.patient, "template": self.template, "issue_date": self.issue_date.isoformat()}
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        if "issue_date" in data:
+            data["issue_date"] = date.fromisoformat(data["issue_date"])
+        return cls(**data)
@@ -0,0 +1,153 @@
+"""
+Motor de renderização de PDFs fora do event loop.
+
+O desenho com reportlab é CPU-bound; executá-lo dentro de um endpoint `async`
+bloqueia todas as outras requisições do worker do uvicorn. O RenderEngine
+mantém um pool de processos "quentes" (reportlab já importado), limita o
+número de jobs pendentes (backpressure) e aplica um timeout por job.
+
+Configuração por variáveis de ambiente:
+    PRESCREVEAI_RENDER_WORKERS  número de processos (padrão: número de CPUs)
+    PRESCREVEAI_RENDER_QUEUE    máximo de jobs pendentes (padrão: 4 x workers)
+    PRESCREVEAI_RENDER_TIMEOUT  timeout por job em segundos (padrão: 30)
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+class RenderQueueFull(Exception):
+    """Levantada quando a fila de renderização atingiu o limite de jobs pendentes."""
+
+
+class RenderTimeout(Exception):
+    """Levantada quando um job não termina dentro do timeout configurado."""
+
+
+def _warm_worker():
+    # Pré-carrega reportlab, as fontes padrão e as camadas estáticas dos templates
+    import pdf_render
+    import template_layers
+    template_layers.compile_layers()
+    pdf_render.generate_simple_pdf([], filename=None)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _render_in_worker(medications, context):
+    import pdf_render
+    return pdf_render.render_pdf(medications, context)
+
+
+def _render_timed_in_worker(medications, context):
+    import pdf_render
+    timings = {}
+    pdf_bytes = pdf_render.render_pdf(medications, context, timings=timings)
+    return pdf_bytes, timings
+
+
+def _render_pages_in_worker(medications, context):
+    import pdf_merge
+    return pdf_merge.render_pages(medications, context)
+
+
+def _render_profiled_in_worker(medications, context, profile_path):
+    import pdf_render
+    import profiling
+    return profiling.call_profiled(profile_path, pdf_render.render_pdf, medications, context)
+
+
+class RenderEngine:
+    def __init__(self, workers=None, max_pending=None, timeout=None):
+        self.workers = workers or int(os.environ.get("PRESCREVEAI_RENDER_WORKERS", 0)) or os.cpu_count() or 1
+        self.max_pending = max_pending or int(os.environ.get("PRESCREVEAI_RENDER_QUEUE", 0)) or 4 * self.workers
+        self.timeout = timeout or float(os.environ.get("PRESCREVEAI_RENDER_TIMEOUT", 30))
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def start(self):
+        """Cria o pool e espera todos os workers terminarem o aquecimento."""
+        if self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker,
+        )
+        # Submeter um job por worker força a criação de todos os processos agora
+        warmups = [self._pool.submit(_ping) for _ in range(self.workers)]
+        for future in warmups:
+            future.result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args):
+        """
+        Submete `fn(*args)` ao pool. Levanta RenderQueueFull se já houver
+        `max_pending` jobs aguardando ou em execução.
+        """
+        if self._pool is None:
+            self.start()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise RenderQueueFull(f"Fila de renderização cheia ({self.max_pending} jobs pendentes)")
+            self._pending += 1
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        # O contador só é liberado quando o processo termina o job, mesmo que
+        # quem aguardava já tenha desistido por timeout.
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args):
+        future = self.submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise RenderTimeout(f"Renderização excedeu {self.timeout:g}s") from None
+
+    async def render(self, medications, context, timings=None):
+        """
+        Renderiza um PDF (render_context.RenderContext) em um processo do pool e
+        retorna os bytes. Com `timings` (dict), guarda os segundos de desenho
+        ("draw"), de c.save() ("save") e o restante do tempo de espera, na fila
+        e na transferência entre processos ("queue").
+        """
+        if timings is None:
+            return await self.run(_render_in_worker, medications, context)
+        started = time.perf_counter()
+        pdf_bytes, worker_timings = await self.run(_render_timed_in_worker, medications, context)
+        timings.update(worker_timings)
+        timings["queue"] = time.perf_counter() - started - worker_timings["draw"] - worker_timings["save"]
+        return pdf_bytes
+
+    async def render_pages(self, medications, context):
+        """
+        Desenha uma prescrição em um processo do pool e retorna suas páginas
+        (pdf_merge.render_pages), para serem juntadas em um PDF combinado.
+        """
+        return await self.run(_render_pages_in_worker, medications, context)
+
+    async def render_profiled(self, medications, context, profile_path):
+        """Como render(), mas sob o cProfile no worker, que grava o perfil em `profile_path`."""
+        return await self.run(_render_profiled_in_worker, medications, context, profile_path)
@@ -0,0 +1,272 @@
+"""
+Gerenciamento dos processos em segundo plano (servidor da API e daemon) via
+arquivos PID.
+
+Cada processo é iniciado em um grupo de processos próprio (setsid) e o arquivo
+PID guarda o PID do processo principal, que é também o id do grupo. Assim o
+status e o stop alcançam o grupo inteiro: os workers do uvicorn e os processos
+de renderização de cada um.
+"""
+import os
+import signal # Import for signal.SIGTERM
+import socket
+import subprocess
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# PID files for the server and daemon processes
+PID_FILE = os.path.join(SCRIPT_DIR, "server.pid")
+DAEMON_PID_FILE = os.path.join(SCRIPT_DIR, "daemon.pid")
+
+# --- Server Management Functions ---
+def _launch_in_background(command, pid_file, env=None):
+    """Starts `command` in its own process group and records its PID in `pid_file`."""
+    process = subprocess.Popen(command, env=env, preexec_fn=os.setsid) # Use setsid to create a new process group
+    with open(pid_file, "w") as f:
+        f.write(str(process.pid))
+    return process
+
+def _read_pid(pid_file):
+    with open(pid_file, "r") as f:
+        return int(f.read().strip())
+
+def _group_processes(pgid):
+    """(pid, ppid) de todos os processos vivos do grupo `pgid`."""
+    try:
+        output = subprocess.run(["ps", "-eo", "pid=,ppid=,pgid="], capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return []
+    processes = []
+    for line in output.splitlines():
+        pid, ppid, group = (int(field) for field in line.split())
+        if group == pgid:
+            processes.append((pid, ppid))
+    return processes
+
+def _wait_group_exit(pgid, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            os.killpg(pgid, 0)
+        except ProcessLookupError:
+            return True
+        time.sleep(0.2)
+    return False
+
+def _stop_process_group(pid_file, label, graceful_timeout=None):
+    """
+    Stops the process group recorded in `pid_file`. With `graceful_timeout`,
+    only the main process gets SIGTERM (so it can drain its workers) and the
+    rest of the group is killed if it is still alive after the timeout.
+    """
+    if not os.path.exists(pid_file):
+        print(f"{label} não está rodando (arquivo PID não encontrado).")
+        return
+
+    pid = _read_pid(pid_file)
+
+    try:
+        if graceful_timeout is None:
+            # Send SIGTERM to the process group to ensure all child processes are killed
+            os.killpg(pid, signal.SIGTERM)
+            print(f"{label} (PID: {pid}) interrompido.")
+        else:
+            os.kill(pid, signal.SIGTERM)
+            print(f"Aguardando o {label} (PID: {pid}) terminar as requisições em andamento...")
+            if _wait_group_exit(pid, graceful_timeout):
+                print(f"{label} (PID: {pid}) interrompido.")
+            else:
+                os.killpg(pid, signal.SIGKILL)
+                print(f"{label} (PID: {pid}) não terminou em {graceful_timeout:g}s e foi encerrado à força.")
+    except ProcessLookupError:
+        print(f"{label} (PID: {pid}) não encontrado ou já encerrado.")
+    except Exception as e:
+        print(f"Erro ao tentar parar o {label}: {e}")
+    finally:
+        if os.path.exists(pid_file):
+            os.remove(pid_file)
+
+def _process_status(pid_file, label):
+    if not os.path.exists(pid_file):
+        print(f"{label} não está rodando (arquivo PID não encontrado).")
+        return
+
+    pid = _read_pid(pid_file)
+
+    try:
+        # Sending signal 0 checks if the process exists without killing it
+        os.kill(pid, 0)
+        print(f"{label} está rodando com PID: {pid}.")
+    except ProcessLookupError:
+        print(f"{label} (PID: {pid}) não está rodando (processo não encontrado).")
+        if os.path.exists(pid_file):
+            os.remove(pid_file) # Clean up stale PID file
+        return
+    except Exception as e:
+        print(f"Erro ao verificar status do {label}: {e}")
+        return
+
+    group = [(child, parent) for child, parent in _group_processes(pid) if child != pid]
+    if group:
+        workers = [child for child, parent in group if parent == pid]
+        print(f"  Processos filhos: {', '.join(map(str, workers))}")
+        print(f"  Total no grupo: {len(group) + 1} processos (inclui os processos de renderização)")
+
+# Tempo dado às requisições em andamento ao parar ou reiniciar o servidor (segundos)
+GRACEFUL_TIMEOUT = 30
+# Prazo para um worker terminar o aquecimento (lifespan), no início e no reload
+WARMUP_TIMEOUT = 60
+
+def _wait_until_listening(process, host, port, timeout=WARMUP_TIMEOUT):
+    """Espera a porta aceitar conexões: os workers só escutam depois do aquecimento (lifespan)."""
+    connect_host = "127.0.0.1" if host in ("0.0.0.0", "") else ("::1" if host == "::" else host)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with socket.create_connection((connect_host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def start_server(host="127.0.0.1", port=8000, workers=1, reload=False):
+    """
+    Starts the API with uvicorn in the background. `workers` processes share
+    the socket (pre-fork); each one warms its renderer in the lifespan before
+    serving. `reload` runs the development mode with the file watcher instead.
+    """
+    if os.path.exists(PID_FILE):
+        try:
+            os.kill(_read_pid(PID_FILE), 0)
+            print(f"Servidor FastAPI já está rodando (PID: {_read_pid(PID_FILE)}). Use 'prescreveai stop' ou 'prescreveai reload'.")
+            return
+        except ProcessLookupError:
+            os.remove(PID_FILE)
+
+    venv_python = os.path.join(SCRIPT_DIR, ".venv", "bin", "python3")
+    python = venv_python if os.path.exists(venv_python) else sys.executable
+    api_server_path = os.path.join(SCRIPT_DIR, "api_server.py")
+
+    if not os.path.exists(api_server_path):
+        print(f"Erro: api_server.py não encontrado em {api_server_path}")
+        sys.exit(1)
+
+    if reload:
+        command = [python, "-m", "uvicorn", "api_server:app", "--host", host, "--port", str(port), "--reload"]
+    else:
+        command = [python, os.path.abspath(__file__), "--host", host, "--port", str(port), "--workers", str(workers)]
+
+    env = os.environ.copy()
+    env['PYTHONPATH'] = SCRIPT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    if not reload and "PRESCREVEAI_RENDER_WORKERS" not in env:
+        # Divide as CPUs entre os workers, em vez de cada um abrir um pool do tamanho da máquina
+        env["PRESCREVEAI_RENDER_WORKERS"] = str(max(1, (os.cpu_count() or 1) // workers))
+
+    print(f"Iniciando servidor FastAPI com: {' '.join(command)}")
+    try:
+        process = _launch_in_background(command, PID_FILE, env=env)
+    except FileNotFoundError:
+        print(f"Erro: interpretador Python ou uvicorn não encontrado em {python}. Certifique-se de que o ambiente virtual está ativado e uvicorn está instalado.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Erro ao iniciar o servidor FastAPI: {e}")
+        sys.exit(1)
+
+    if _wait_until_listening(process, host, port):
+        mode = "modo de desenvolvimento (--reload)" if reload else f"{workers} worker(s)"
+        print(f"Servidor FastAPI iniciado em segundo plano (PID: {process.pid}, {mode}). Acesse http://{host}:{port}/docs")
+    else:
+        print(f"Erro: o servidor FastAPI (PID: {process.pid}) não começou a escutar em {host}:{port}.")
+        if process.poll() is None:
+            _stop_process_group(PID_FILE, "Servidor FastAPI")
+        elif os.path.exists(PID_FILE):
+            os.remove(PID_FILE)
+        sys.exit(1)
+
+def _serve_api(argv):
+    """
+    Runs the API under uvicorn's process supervisor, even with a single
+    worker: `uvicorn --workers 1` runs the server without it, and SIGHUP
+    would then kill the server instead of replacing the worker.
+    """
+    import argparse
+    import uvicorn
+    from uvicorn.supervisors import Multiprocess
+
+    parser = argparse.ArgumentParser(prog="server_control.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+    config = uvicorn.Config(
+        "api_server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        timeout_worker_healthcheck=WARMUP_TIMEOUT,
+    )
+    Multiprocess(config, sockets=[config.bind_socket()]).run()
+
+def reload_server():
+    """
+    Graceful restart: SIGHUP makes uvicorn (>= 0.51) replace its workers one
+    at a time, starting each replacement and waiting for its warm-up
+    (lifespan) before the old worker drains and exits. If a replacement is
+    not ready within WARMUP_TIMEOUT, uvicorn keeps the old worker and stops
+    the restart.
+    """
+    if not os.path.exists(PID_FILE):
+        print("Servidor FastAPI não está rodando (arquivo PID não encontrado).")
+        return
+    pid = _read_pid(PID_FILE)
+    args = subprocess.run(["ps", "-o", "args=", "-p", str(pid)], capture_output=True, text=True).stdout
+    if "--reload" in args.split():
+        # O reloader do uvicorn não trata SIGHUP; no modo de desenvolvimento ele já recarrega sozinho
+        print("Servidor FastAPI está em modo de desenvolvimento (--reload): os workers já são recarregados a cada alteração.")
+        return
+    try:
+        os.kill(pid, signal.SIGHUP)
+        print(f"Servidor FastAPI (PID: {pid}) reiniciando os workers.")
+    except ProcessLookupError:
+        print(f"Servidor FastAPI (PID: {pid}) não está rodando (processo não encontrado).")
+        os.remove(PID_FILE)
+
+def stop_server():
+    _stop_process_group(PID_FILE, "Servidor FastAPI", graceful_timeout=GRACEFUL_TIMEOUT + 5)
+
+def server_status():
+    _process_status(PID_FILE, "Servidor FastAPI")
+
+def start_daemon():
+    """Starts the warm daemon (prescreveai_daemon.py) in the background, listening on daemon.SOCKET_PATH."""
+    import prescreveai_daemon as daemon
+    if daemon.is_running():
+        print(f"Daemon já está rodando em {daemon.SOCKET_PATH}.")
+        return
+
+    command = [sys.executable, os.path.join(SCRIPT_DIR, "prescreveai.py"), "daemon", "--foreground"]
+    try:
+        process = _launch_in_background(command, DAEMON_PID_FILE)
+    except Exception as e:
+        print(f"Erro ao iniciar o daemon: {e}")
+        sys.exit(1)
+
+    if daemon.wait_until_ready():
+        print(f"Daemon iniciado em segundo plano (PID: {process.pid}), socket: {daemon.SOCKET_PATH}")
+    else:
+        print(f"Erro: o daemon (PID: {process.pid}) não respondeu em {daemon.SOCKET_PATH}.")
+        sys.exit(1)
+
+def stop_daemon():
+    _stop_process_group(DAEMON_PID_FILE, "Daemon")
+
+def daemon_status():
+    _process_status(DAEMON_PID_FILE, "Daemon")
+
+if __name__ == "__main__":
+    _serve_api(sys.argv[1:])
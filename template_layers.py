@@ -0,0 +1,166 @@
+"""
+Camadas estáticas pré-compiladas dos templates de PDF.
+
+Boa parte de cada template (caixas, títulos de seção, linhas separadoras,
+rodapé) é idêntica em todos os documentos. Cada camada é compilada uma única
+vez por processo: todas as caixas e linhas viram um único path (um só
+operador de stroke) e os textos viram trechos já posicionados, agrupados por
+fonte, desenhados em um único objeto de texto. Os geradores em pdf_render.py
+desenham a camada e só então sobrepõem o conteúdo dinâmico (emitente, data,
+paciente e medicações).
+"""
+from functools import lru_cache
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.pathobject import PDFPathObject
+
+# --- Geometria da página ---
+PAGE_WIDTH, PAGE_HEIGHT = letter
+LEFT_MARGIN = inch
+RIGHT_MARGIN = PAGE_WIDTH - inch
+TOP_MARGIN = PAGE_HEIGHT - inch
+BOTTOM_MARGIN = inch
+
+# --- Geometria do template memed ---
+BOX_WIDTH = 3.5 * inch
+BOX_HEIGHT = 1.2 * inch
+EMITTER_BOX_X = LEFT_MARGIN
+EMITTER_BOX_Y = TOP_MARGIN - 0.7 * inch - 70
+RECEITUARIO_BOX_X = LEFT_MARGIN + BOX_WIDTH + 0.2 * inch
+RECEITUARIO_BOX_Y = EMITTER_BOX_Y
+RECEITUARIO_BOX_WIDTH = RIGHT_MARGIN - RECEITUARIO_BOX_X
+PATIENT_Y = EMITTER_BOX_Y - 0.2 * inch - 30
+MEDICATIONS_START_Y = PATIENT_Y - 0.5 * inch - 20
+COMPRADOR_BOX_X = LEFT_MARGIN
+COMPRADOR_BOX_Y = BOTTOM_MARGIN + 0.5 * inch
+FORNECEDOR_BOX_X = LEFT_MARGIN + BOX_WIDTH + 0.2 * inch
+FORNECEDOR_BOX_Y = COMPRADOR_BOX_Y
+# Lista de medicações: linhas quebradas na largura entre as margens, a
+# assinatura logo abaixo e, na última página, acima das caixas do comprador e
+# do fornecedor
+MEMED_MEDICATION_FONT = ("Helvetica", 9)
+MEMED_LINE_LEADING = 11
+MEMED_MEDICATION_GAP = 4
+MEMED_MEDICATIONS_BOTTOM = BOTTOM_MARGIN + 1.5 * inch
+MEMED_CONTINUATION_TOP = TOP_MARGIN - 0.5 * inch
+MEMED_LAST_PAGE_BOTTOM = COMPRADOR_BOX_Y + BOX_HEIGHT + 10
+SIGNATURE_OFFSET = 0.5 * inch
+SIGNATURE_HEIGHT = SIGNATURE_OFFSET + 10
+
+# --- Geometria do template simple ---
+SIMPLE_HEADER_Y = PAGE_HEIGHT - inch - 0.5 * inch
+SIMPLE_MEDICATIONS_START_Y = SIMPLE_HEADER_Y - 100
+SIMPLE_MEDICATION_FONT = ("Helvetica", 12)
+SIMPLE_LINE_LEADING = 14
+SIMPLE_MEDICATION_GAP = 6
+SIMPLE_CONTINUATION_TOP = PAGE_HEIGHT - inch
+
+
+class StaticLayer:
+    """Conteúdo fixo de um template, pronto para ser desenhado em qualquer canvas."""
+
+    def __init__(self, path, text_runs):
+        self.path = path
+        # ((fonte, tamanho), ((x, y, texto), ...)), na ordem de desenho
+        self.text_runs = text_runs
+
+    def draw(self, c):
+        # saveState/restoreState isolam a fonte usada pela camada do estado do canvas
+        c.saveState()
+        if self.path is not None:
+            c.drawPath(self.path, stroke=1, fill=0)
+        text = c.beginText()
+        for (font, size), runs in self.text_runs:
+            text.setFont(font, size)
+            for x, y, s in runs:
+                text.setTextOrigin(x, y)
+                text.textLine(s)
+        c.drawText(text)
+        c.restoreState()
+
+
+class _LayerBuilder:
+    def __init__(self):
+        self.path = None
+        self.runs = {}
+
+    def _path(self):
+        if self.path is None:
+            self.path = PDFPathObject()
+        return self.path
+
+    def rect(self, x, y, width, height):
+        self._path().rect(x, y, width, height)
+
+    def line(self, x1, y1, x2, y2):
+        path = self._path()
+        path.moveTo(x1, y1)
+        path.lineTo(x2, y2)
+
+    def text(self, font, size, x, y, s):
+        self.runs.setdefault((font, size), []).append((x, y, s))
+
+    def centred_text(self, font, size, x, y, s):
+        self.text(font, size, x - stringWidth(s, font, size) / 2.0, y, s)
+
+    def titled_box(self, x, y, width, title):
+        self.rect(x, y, width, BOX_HEIGHT)
+        self.text("Helvetica-Bold", 9, x + 5, y + BOX_HEIGHT - 15, title)
+        self.line(x, y + BOX_HEIGHT - 20, x + width, y + BOX_HEIGHT - 20)
+
+    def build(self):
+        return StaticLayer(self.path, tuple((key, tuple(runs)) for key, runs in self.runs.items()))
+
+
+@lru_cache(maxsize=None)
+def memed_first_page_layer():
+    """Cabeçalho, caixas do emitente e do receituário e separador do paciente."""
+    b = _LayerBuilder()
+    b.text("Helvetica-Bold", 14, LEFT_MARGIN, TOP_MARGIN, "SYNAPSI") # Placeholder for logo
+    b.text("Helvetica-Bold", 12, LEFT_MARGIN + 1.5 * inch, TOP_MARGIN, "Dr. André Batista Millet Neves")
+    b.text("Helvetica", 10, LEFT_MARGIN + 1.5 * inch, TOP_MARGIN - 15, "Neurologia - CRM 52946788")
+
+    b.titled_box(EMITTER_BOX_X, EMITTER_BOX_Y, BOX_WIDTH, "IDENTIFICAÇÃO DO EMITENTE")
+    b.titled_box(RECEITUARIO_BOX_X, RECEITUARIO_BOX_Y, RECEITUARIO_BOX_WIDTH, "RECEITUÁRIO CONTROLE ESPECIAL")
+    b.text("Helvetica", 8, RECEITUARIO_BOX_X + 5, RECEITUARIO_BOX_Y + BOX_HEIGHT - 45, "1a. via farmácia")
+    b.text("Helvetica", 8, RECEITUARIO_BOX_X + 5, RECEITUARIO_BOX_Y + BOX_HEIGHT - 55, "2a. via paciente")
+
+    b.line(LEFT_MARGIN, PATIENT_Y - 25, RIGHT_MARGIN, PATIENT_Y - 25)
+    return b.build()
+
+
+@lru_cache(maxsize=None)
+def memed_last_page_layer():
+    """Caixas do comprador e do fornecedor e o rodapé com o endereço."""
+    b = _LayerBuilder()
+    b.titled_box(COMPRADOR_BOX_X, COMPRADOR_BOX_Y, BOX_WIDTH, "IDENTIFICAÇÃO DO COMPRADOR")
+    text_y = COMPRADOR_BOX_Y + BOX_HEIGHT - 35
+    for i, label in enumerate(["Nome:", "RG:", "Endereço:", "Telefone:", "Cidade e UF:"]):
+        b.text("Helvetica", 8, COMPRADOR_BOX_X + 5, text_y - 10 * i, label)
+
+    b.titled_box(FORNECEDOR_BOX_X, FORNECEDOR_BOX_Y, RECEITUARIO_BOX_WIDTH, "IDENTIFICAÇÃO DO FORNECEDOR")
+    text_y = FORNECEDOR_BOX_Y + BOX_HEIGHT - 35
+    b.text("Helvetica", 8, FORNECEDOR_BOX_X + 5, text_y, "DATA")
+    b.text("Helvetica", 8, FORNECEDOR_BOX_X + 5, text_y - 10, "ASSINATURA DO FARMACÊUTICO")
+
+    b.centred_text("Helvetica", 8, PAGE_WIDTH / 2, BOTTOM_MARGIN - 0.2 * inch, "Av.das Américas - 500. Shopping Downtown.")
+    b.centred_text("Helvetica", 8, PAGE_WIDTH / 2, BOTTOM_MARGIN - 0.35 * inch, "Bloco 12 sala 207 - Barra da Tijuca")
+    return b.build()
+
+
+@lru_cache(maxsize=None)
+def simple_first_page_layer():
+    """Título do documento e cabeçalho da lista de medicações."""
+    b = _LayerBuilder()
+    b.text("Helvetica-Bold", 16, inch, PAGE_HEIGHT - inch, "Prescrição Médica Simples")
+    b.text("Helvetica-Bold", 14, inch, SIMPLE_HEADER_Y - 80, "Medicações:")
+    return b.build()
+
+
+def compile_layers():
+    """Compila todas as camadas de uma vez (chamado no aquecimento dos workers)."""
+    memed_first_page_layer()
+    memed_last_page_layer()
+    simple_first_page_layer()